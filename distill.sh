@@ -0,0 +1,5 @@
+#!/usr/bin/env bash
+
+set -e -o pipefail
+
+SLOW_DIFFUSION_TYPECHECK=${SLOW_DIFFUSION_TYPECHECK:-0} PYTHONPATH=. python slow_diffusion/distill_cli.py fit --config configs/$1.yaml
\ No newline at end of file
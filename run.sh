@@ -2,4 +2,4 @@
 
 set -e -o pipefail
 
-PYTHONPATH=. python slow_diffusion/cli.py fit --config configs/$1.yaml
\ No newline at end of file
+SLOW_DIFFUSION_TYPECHECK=${SLOW_DIFFUSION_TYPECHECK:-0} PYTHONPATH=. python slow_diffusion/cli.py fit --config configs/$1.yaml
\ No newline at end of file
@@ -5,26 +5,59 @@ d = { 'settings': { 'branch': 'main',
                 'doc_host': 'https://jeremyadamsfisher.github.io',
                 'git_url': 'https://github.com/jeremyadamsfisher/slow_diffusion',
                 'lib_path': 'slow_diffusion'},
-  'syms': { 'slow_diffusion.cli': {},
-            'slow_diffusion.data': { 'slow_diffusion.data.DiffusionDataModule': ('data.html#diffusiondatamodule', 'slow_diffusion/data.py'),
+  'syms': { 'slow_diffusion.autoencoder_cli': {},
+            'slow_diffusion.cli': {},
+            'slow_diffusion.data': { 'slow_diffusion.data.CosineSchedule': ('data.html#cosineschedule', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.CosineSchedule._ᾱ': ('data.html#cosineschedule._ᾱ', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.CosineSchedule.t_from_λ': ( 'data.html#cosineschedule.t_from_λ',
+                                                                                      'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule': ('data.html#diffusiondatamodule', 'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.__init__': ( 'data.html#diffusiondatamodule.__init__',
                                                                                            'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule._build': ( 'data.html#diffusiondatamodule._build',
+                                                                                         'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule._collate': ( 'data.html#diffusiondatamodule._collate',
                                                                                            'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule._fill': ( 'data.html#diffusiondatamodule._fill',
+                                                                                        'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule._fill_all': ( 'data.html#diffusiondatamodule._fill_all',
+                                                                                            'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule._freeze': ( 'data.html#diffusiondatamodule._freeze',
                                                                                           'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule._freeze_seeds': ( 'data.html#diffusiondatamodule._freeze_seeds',
+                                                                                                'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule._frozen_collate': ( 'data.html#diffusiondatamodule._frozen_collate',
                                                                                                   'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule._seeded_collate': ( 'data.html#diffusiondatamodule._seeded_collate',
+                                                                                                  'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule._store': ( 'data.html#diffusiondatamodule._store',
+                                                                                         'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.cache_key': ( 'data.html#diffusiondatamodule.cache_key',
+                                                                                            'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.cached_dir': ( 'data.html#diffusiondatamodule.cached_dir',
                                                                                              'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.clean': ( 'data.html#diffusiondatamodule.clean',
                                                                                         'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.clean_path': ( 'data.html#diffusiondatamodule.clean_path',
+                                                                                             'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.frozen_paths': ( 'data.html#diffusiondatamodule.frozen_paths',
+                                                                                               'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.load': ( 'data.html#diffusiondatamodule.load',
+                                                                                       'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.n_workers': ( 'data.html#diffusiondatamodule.n_workers',
                                                                                             'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.noisify_fn': ( 'data.html#diffusiondatamodule.noisify_fn',
                                                                                              'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.normalize': ( 'data.html#diffusiondatamodule.normalize',
+                                                                                            'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.num_proc': ( 'data.html#diffusiondatamodule.num_proc',
+                                                                                           'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.post_process': ( 'data.html#diffusiondatamodule.post_process',
                                                                                                'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.prepare_data': ( 'data.html#diffusiondatamodule.prepare_data',
+                                                                                               'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.seeded_paths': ( 'data.html#diffusiondatamodule.seeded_paths',
+                                                                                               'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.setup': ( 'data.html#diffusiondatamodule.setup',
                                                                                         'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.to_tensor': ( 'data.html#diffusiondatamodule.to_tensor',
@@ -33,27 +66,222 @@ d = { 'settings': { 'branch': 'main',
                                                                                                    'slow_diffusion/data.py'),
                                      'slow_diffusion.data.DiffusionDataModule.val_dataloader': ( 'data.html#diffusiondatamodule.val_dataloader',
                                                                                                  'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.DiffusionDataModule.x_0_path': ( 'data.html#diffusiondatamodule.x_0_path',
+                                                                                           'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.LinearSchedule': ('data.html#linearschedule', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.LinearSchedule.__init__': ( 'data.html#linearschedule.__init__',
+                                                                                      'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.LinearSchedule._ᾱ': ('data.html#linearschedule._ᾱ', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.LinearSchedule.t_from_λ': ( 'data.html#linearschedule.t_from_λ',
+                                                                                      'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset': ('data.html#memmapdataset', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset.__getitem__': ( 'data.html#memmapdataset.__getitem__',
+                                                                                        'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset.__getitems__': ( 'data.html#memmapdataset.__getitems__',
+                                                                                         'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset.__getstate__': ( 'data.html#memmapdataset.__getstate__',
+                                                                                         'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset.__init__': ( 'data.html#memmapdataset.__init__',
+                                                                                     'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset.__len__': ( 'data.html#memmapdataset.__len__',
+                                                                                    'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.MemmapDataset.arrays': ( 'data.html#memmapdataset.arrays',
+                                                                                   'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.NoiseSchedule': ('data.html#noiseschedule', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.NoiseSchedule._ᾱ': ('data.html#noiseschedule._ᾱ', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.NoiseSchedule.t_from_λ': ( 'data.html#noiseschedule.t_from_λ',
+                                                                                     'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.NoiseSchedule.α_σ': ('data.html#noiseschedule.α_σ', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.NoiseSchedule.λ': ('data.html#noiseschedule.λ', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.NoiseSchedule.ᾱ': ('data.html#noiseschedule.ᾱ', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.SeededBatch': ('data.html#seededbatch', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data._atomic_dir': ('data.html#_atomic_dir', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data._call_map_fn': ('data.html#_call_map_fn', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data._create_npy': ('data.html#_create_npy', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data._fork_map': ('data.html#_fork_map', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data._mulhilo32': ('data.html#_mulhilo32', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data._source': ('data.html#_source', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.get_noise_schedule': ('data.html#get_noise_schedule', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.get_t_checking': ('data.html#get_t_checking', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.noise_draws': ('data.html#noise_draws', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.noise_schedule': ('data.html#noise_schedule', 'slow_diffusion/data.py'),
                                      'slow_diffusion.data.noisify': ('data.html#noisify', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.noisify_batch': ('data.html#noisify_batch', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.noisify_draws': ('data.html#noisify_draws', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.philox4x32': ('data.html#philox4x32', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.seeded_randn': ('data.html#seeded_randn', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.set_noise_schedule': ('data.html#set_noise_schedule', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.set_t_checking': ('data.html#set_t_checking', 'slow_diffusion/data.py'),
                                      'slow_diffusion.data.show_images': ('data.html#show_images', 'slow_diffusion/data.py'),
+                                     'slow_diffusion.data.t_checking': ('data.html#t_checking', 'slow_diffusion/data.py'),
                                      'slow_diffusion.data.ᾱ': ('data.html#ᾱ', 'slow_diffusion/data.py')},
             'slow_diffusion.ddpm': { 'slow_diffusion.ddpm.DDPMCallback': ('ddpm.html#ddpmcallback', 'slow_diffusion/ddpm.py'),
                                      'slow_diffusion.ddpm.DDPMCallback.__init__': ( 'ddpm.html#ddpmcallback.__init__',
                                                                                     'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.DDPMCallback.model': ('ddpm.html#ddpmcallback.model', 'slow_diffusion/ddpm.py'),
                                      'slow_diffusion.ddpm.DDPMCallback.on_train_epoch_end': ( 'ddpm.html#ddpmcallback.on_train_epoch_end',
                                                                                               'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.DDPMCallback.sample': ('ddpm.html#ddpmcallback.sample', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm._memory_format': ('ddpm.html#_memory_format', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm._progress': ('ddpm.html#_progress', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm._start': ('ddpm.html#_start', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.adaptive': ('ddpm.html#adaptive', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.compile_for_sampling': ( 'ddpm.html#compile_for_sampling',
+                                                                                   'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.ddim': ('ddpm.html#ddim', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.ddim_step': ('ddpm.html#ddim_step', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.ddim_step_with': ('ddpm.html#ddim_step_with', 'slow_diffusion/ddpm.py'),
                                      'slow_diffusion.ddpm.ddpm': ('ddpm.html#ddpm', 'slow_diffusion/ddpm.py'),
-                                     'slow_diffusion.ddpm.denoisify': ('ddpm.html#denoisify', 'slow_diffusion/ddpm.py')},
+                                     'slow_diffusion.ddpm.denoisify': ('ddpm.html#denoisify', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.denoisify_with': ('ddpm.html#denoisify_with', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.dpm_solver_pp': ('ddpm.html#dpm_solver_pp', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.get_sampler': ('ddpm.html#get_sampler', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.heun': ('ddpm.html#heun', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.picard': ('ddpm.html#picard', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.progress_bars': ('ddpm.html#progress_bars', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.set_progress_bars': ('ddpm.html#set_progress_bars', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.t_from_λ': ('ddpm.html#t_from_λ', 'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.time_embedding_cache': ( 'ddpm.html#time_embedding_cache',
+                                                                                   'slow_diffusion/ddpm.py'),
+                                     'slow_diffusion.ddpm.λ': ('ddpm.html#λ', 'slow_diffusion/ddpm.py')},
+            'slow_diffusion.distill_cli': {},
+            'slow_diffusion.distillation': { 'slow_diffusion.distillation.DistillationDDPMCallback': ( 'distillation.html#distillationddpmcallback',
+                                                                                                       'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationDDPMCallback.__init__': ( 'distillation.html#distillationddpmcallback.__init__',
+                                                                                                                'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationDDPMCallback.on_train_epoch_end': ( 'distillation.html#distillationddpmcallback.on_train_epoch_end',
+                                                                                                                          'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning': ( 'distillation.html#distillationlightning',
+                                                                                                    'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.__init__': ( 'distillation.html#distillationlightning.__init__',
+                                                                                                             'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.configure_optimizers': ( 'distillation.html#distillationlightning.configure_optimizers',
+                                                                                                                         'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.on_after_batch_transfer': ( 'distillation.html#distillationlightning.on_after_batch_transfer',
+                                                                                                                            'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.on_load_checkpoint': ( 'distillation.html#distillationlightning.on_load_checkpoint',
+                                                                                                                       'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.on_save_checkpoint': ( 'distillation.html#distillationlightning.on_save_checkpoint',
+                                                                                                                       'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.on_train_epoch_end': ( 'distillation.html#distillationlightning.on_train_epoch_end',
+                                                                                                                       'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.train': ( 'distillation.html#distillationlightning.train',
+                                                                                                          'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.DistillationLightning.training_step': ( 'distillation.html#distillationlightning.training_step',
+                                                                                                                  'slow_diffusion/distillation.py'),
+                                             'slow_diffusion.distillation.distillation_target': ( 'distillation.html#distillation_target',
+                                                                                                  'slow_diffusion/distillation.py')},
             'slow_diffusion.fashionmnist': { 'slow_diffusion.fashionmnist.FashionMNISTDataModule': ( 'fashion_mnist.html#fashionmnistdatamodule',
                                                                                                      'slow_diffusion/fashionmnist.py'),
                                              'slow_diffusion.fashionmnist.FashionMNISTDataModule.__init__': ( 'fashion_mnist.html#fashionmnistdatamodule.__init__',
                                                                                                               'slow_diffusion/fashionmnist.py'),
-                                             'slow_diffusion.fashionmnist.FashionMNISTDataModule.noisify_fn': ( 'fashion_mnist.html#fashionmnistdatamodule.noisify_fn',
-                                                                                                                'slow_diffusion/fashionmnist.py'),
+                                             'slow_diffusion.fashionmnist.FashionMNISTDataModule.normalize': ( 'fashion_mnist.html#fashionmnistdatamodule.normalize',
+                                                                                                               'slow_diffusion/fashionmnist.py'),
                                              'slow_diffusion.fashionmnist.TinyFashionMNISTDataModule': ( 'fashion_mnist.html#tinyfashionmnistdatamodule',
                                                                                                          'slow_diffusion/fashionmnist.py'),
                                              'slow_diffusion.fashionmnist.TinyFashionMNISTDataModule.post_process': ( 'fashion_mnist.html#tinyfashionmnistdatamodule.post_process',
                                                                                                                       'slow_diffusion/fashionmnist.py')},
+            'slow_diffusion.inference': { 'slow_diffusion.inference.ChannelAffine': ( 'inference.html#channelaffine',
+                                                                                      'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.ChannelAffine.__init__': ( 'inference.html#channelaffine.__init__',
+                                                                                               'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.ChannelAffine.forward': ( 'inference.html#channelaffine.forward',
+                                                                                              'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.ChannelAffine.from_batchnorm': ( 'inference.html#channelaffine.from_batchnorm',
+                                                                                                     'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.OnnxUnet': ('inference.html#onnxunet', 'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.OnnxUnet.__call__': ( 'inference.html#onnxunet.__call__',
+                                                                                          'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.OnnxUnet.__init__': ( 'inference.html#onnxunet.__init__',
+                                                                                          'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference._bn_scale_shift': ( 'inference.html#_bn_scale_shift',
+                                                                                        'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference._quantized_regions': ( 'inference.html#_quantized_regions',
+                                                                                           'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.denoising_mse': ( 'inference.html#denoising_mse',
+                                                                                      'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.export_onnx': ( 'inference.html#export_onnx',
+                                                                                    'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.fold_bn_into_conv': ( 'inference.html#fold_bn_into_conv',
+                                                                                          'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.fold_bn_into_linear': ( 'inference.html#fold_bn_into_linear',
+                                                                                            'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.fold_bn_into_mixer': ( 'inference.html#fold_bn_into_mixer',
+                                                                                           'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.fuse_for_inference': ( 'inference.html#fuse_for_inference',
+                                                                                           'slow_diffusion/inference.py'),
+                                          'slow_diffusion.inference.quantize_static': ( 'inference.html#quantize_static',
+                                                                                        'slow_diffusion/inference.py')},
             'slow_diffusion.init': {},
+            'slow_diffusion.latent': { 'slow_diffusion.latent.Autoencoder': ('latent.html#autoencoder', 'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.Autoencoder.__init__': ( 'latent.html#autoencoder.__init__',
+                                                                                       'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.Autoencoder.decode': ( 'latent.html#autoencoder.decode',
+                                                                                     'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.Autoencoder.encode': ( 'latent.html#autoencoder.encode',
+                                                                                     'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.Autoencoder.forward': ( 'latent.html#autoencoder.forward',
+                                                                                      'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.AutoencoderLightning': ( 'latent.html#autoencoderlightning',
+                                                                                       'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.AutoencoderLightning.__init__': ( 'latent.html#autoencoderlightning.__init__',
+                                                                                                'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.AutoencoderLightning.configure_optimizers': ( 'latent.html#autoencoderlightning.configure_optimizers',
+                                                                                                            'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.AutoencoderLightning.step': ( 'latent.html#autoencoderlightning.step',
+                                                                                            'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.AutoencoderLightning.training_step': ( 'latent.html#autoencoderlightning.training_step',
+                                                                                                     'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.AutoencoderLightning.validation_step': ( 'latent.html#autoencoderlightning.validation_step',
+                                                                                                       'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule': ('latent.html#imagedatamodule', 'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule.__init__': ( 'latent.html#imagedatamodule.__init__',
+                                                                                           'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule._collate': ( 'latent.html#imagedatamodule._collate',
+                                                                                           'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule.dataloader': ( 'latent.html#imagedatamodule.dataloader',
+                                                                                             'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule.prepare_data': ( 'latent.html#imagedatamodule.prepare_data',
+                                                                                               'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule.setup': ( 'latent.html#imagedatamodule.setup',
+                                                                                        'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule.train_dataloader': ( 'latent.html#imagedatamodule.train_dataloader',
+                                                                                                   'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.ImageDataModule.val_dataloader': ( 'latent.html#imagedatamodule.val_dataloader',
+                                                                                                 'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDDPMCallback': ( 'latent.html#latentddpmcallback',
+                                                                                     'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDDPMCallback.sample': ( 'latent.html#latentddpmcallback.sample',
+                                                                                            'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule': ( 'latent.html#latentdatamodule',
+                                                                                   'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.__init__': ( 'latent.html#latentdatamodule.__init__',
+                                                                                            'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule._collate': ( 'latent.html#latentdatamodule._collate',
+                                                                                            'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule._encode': ( 'latent.html#latentdatamodule._encode',
+                                                                                           'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule._freeze': ( 'latent.html#latentdatamodule._freeze',
+                                                                                           'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule._frozen_collate': ( 'latent.html#latentdatamodule._frozen_collate',
+                                                                                                   'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule._load_autoencoder': ( 'latent.html#latentdatamodule._load_autoencoder',
+                                                                                                     'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.cached_dir': ( 'latent.html#latentdatamodule.cached_dir',
+                                                                                              'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.clean': ( 'latent.html#latentdatamodule.clean',
+                                                                                         'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.prepare_data': ( 'latent.html#latentdatamodule.prepare_data',
+                                                                                                'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.setup': ( 'latent.html#latentdatamodule.setup',
+                                                                                         'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.train_dataloader': ( 'latent.html#latentdatamodule.train_dataloader',
+                                                                                                    'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.LatentDataModule.val_dataloader': ( 'latent.html#latentdatamodule.val_dataloader',
+                                                                                                  'slow_diffusion/latent.py'),
+                                       'slow_diffusion.latent.load_autoencoder': ( 'latent.html#load_autoencoder',
+                                                                                   'slow_diffusion/latent.py')},
+            'slow_diffusion.loadgen': {},
             'slow_diffusion.model': { 'slow_diffusion.model.Downblock': ('model.html#downblock', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Downblock.__init__': ( 'model.html#downblock.__init__',
                                                                                    'slow_diffusion/model.py'),
@@ -77,6 +305,18 @@ d = { 'settings': { 'branch': 'main',
                                                                                             'slow_diffusion/model.py'),
                                       'slow_diffusion.model.PreactResBlock.residual': ( 'model.html#preactresblock.residual',
                                                                                         'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingCache': ( 'model.html#timeembeddingcache',
+                                                                                   'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingCache.__init__': ( 'model.html#timeembeddingcache.__init__',
+                                                                                            'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingCache.add': ( 'model.html#timeembeddingcache.add',
+                                                                                       'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingCache.check': ( 'model.html#timeembeddingcache.check',
+                                                                                         'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingCache.lookup': ( 'model.html#timeembeddingcache.lookup',
+                                                                                          'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingCache.weights': ( 'model.html#timeembeddingcache.weights',
+                                                                                           'slow_diffusion/model.py'),
                                       'slow_diffusion.model.TimeEmbeddingMLP': ('model.html#timeembeddingmlp', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.TimeEmbeddingMLP.__init__': ( 'model.html#timeembeddingmlp.__init__',
                                                                                           'slow_diffusion/model.py'),
@@ -88,16 +328,29 @@ d = { 'settings': { 'branch': 'main',
                                                                                             'slow_diffusion/model.py'),
                                       'slow_diffusion.model.TimeEmbeddingMixer.forward': ( 'model.html#timeembeddingmixer.forward',
                                                                                            'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.TimeEmbeddingMixer.modulation': ( 'model.html#timeembeddingmixer.modulation',
+                                                                                              'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Unet': ('model.html#unet', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Unet.__init__': ('model.html#unet.__init__', 'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.Unet._checkpointed': ( 'model.html#unet._checkpointed',
+                                                                                   'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.Unet.cached_time_embeddings': ( 'model.html#unet.cached_time_embeddings',
+                                                                                            'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Unet.forward': ('model.html#unet.forward', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Upblock': ('model.html#upblock', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Upblock.__init__': ('model.html#upblock.__init__', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Upblock.forward': ('model.html#upblock.forward', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.Upblock.from_downblock': ( 'model.html#upblock.from_downblock',
                                                                                        'slow_diffusion/model.py'),
+                                      'slow_diffusion.model._cat_channels': ('model.html#_cat_channels', 'slow_diffusion/model.py'),
+                                      'slow_diffusion.model._preserved_batchnorm_stats': ( 'model.html#_preserved_batchnorm_stats',
+                                                                                           'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.compile_unet': ('model.html#compile_unet', 'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.set_typechecking': ('model.html#set_typechecking', 'slow_diffusion/model.py'),
                                       'slow_diffusion.model.timestep_embedding': ( 'model.html#timestep_embedding',
-                                                                                   'slow_diffusion/model.py')},
+                                                                                   'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.typechecked': ('model.html#typechecked', 'slow_diffusion/model.py'),
+                                      'slow_diffusion.model.typechecking': ('model.html#typechecking', 'slow_diffusion/model.py')},
             'slow_diffusion.monitoring': { 'slow_diffusion.monitoring.CountDeadUnitsCallback': ( 'monitoring.html#countdeadunitscallback',
                                                                                                  'slow_diffusion/monitoring.py'),
                                            'slow_diffusion.monitoring.CountDeadUnitsCallback.__init__': ( 'monitoring.html#countdeadunitscallback.__init__',
@@ -138,12 +391,120 @@ d = { 'settings': { 'branch': 'main',
                                            'slow_diffusion.monitoring.StatsCallback.plot': ( 'monitoring.html#statscallback.plot',
                                                                                              'slow_diffusion/monitoring.py')},
             'slow_diffusion.predict': {},
+            'slow_diffusion.streaming': { 'slow_diffusion.streaming.ShardStream': ( 'streaming.html#shardstream',
+                                                                                    'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.ShardStream.__init__': ( 'streaming.html#shardstream.__init__',
+                                                                                             'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.ShardStream.__iter__': ( 'streaming.html#shardstream.__iter__',
+                                                                                             'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.ShardStream._images': ( 'streaming.html#shardstream._images',
+                                                                                            'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.ShardStream.n_batches': ( 'streaming.html#shardstream.n_batches',
+                                                                                              'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.ShardStream.slots': ( 'streaming.html#shardstream.slots',
+                                                                                          'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule': ( 'streaming.html#streamingdatamodule',
+                                                                                            'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.__init__': ( 'streaming.html#streamingdatamodule.__init__',
+                                                                                                     'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule._collate': ( 'streaming.html#streamingdatamodule._collate',
+                                                                                                     'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule._seeded_collate': ( 'streaming.html#streamingdatamodule._seeded_collate',
+                                                                                                            'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.batch_done': ( 'streaming.html#streamingdatamodule.batch_done',
+                                                                                                       'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.epoch_done': ( 'streaming.html#streamingdatamodule.epoch_done',
+                                                                                                       'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.load_state_dict': ( 'streaming.html#streamingdatamodule.load_state_dict',
+                                                                                                            'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.n_workers': ( 'streaming.html#streamingdatamodule.n_workers',
+                                                                                                      'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.noise_draws_per_image': ( 'streaming.html#streamingdatamodule.noise_draws_per_image',
+                                                                                                                  'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.normalize': ( 'streaming.html#streamingdatamodule.normalize',
+                                                                                                      'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.setup': ( 'streaming.html#streamingdatamodule.setup',
+                                                                                                  'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.state_dict': ( 'streaming.html#streamingdatamodule.state_dict',
+                                                                                                       'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.stream': ( 'streaming.html#streamingdatamodule.stream',
+                                                                                                   'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.train_dataloader': ( 'streaming.html#streamingdatamodule.train_dataloader',
+                                                                                                             'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.val_dataloader': ( 'streaming.html#streamingdatamodule.val_dataloader',
+                                                                                                           'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.StreamingDataModule.world_size': ( 'streaming.html#streamingdatamodule.world_size',
+                                                                                                       'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Progress': ('streaming.html#_progress', 'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Progress.on_train_batch_end': ( 'streaming.html#_progress.on_train_batch_end',
+                                                                                                     'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Progress.on_train_epoch_end': ( 'streaming.html#_progress.on_train_epoch_end',
+                                                                                                     'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Resumable': ( 'streaming.html#_resumable',
+                                                                                   'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Resumable.__init__': ( 'streaming.html#_resumable.__init__',
+                                                                                            'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Resumable.__iter__': ( 'streaming.html#_resumable.__iter__',
+                                                                                            'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._Resumable.__len__': ( 'streaming.html#_resumable.__len__',
+                                                                                           'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._batches': ('streaming.html#_batches', 'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._is_image': ('streaming.html#_is_image', 'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming._splitmix64': ( 'streaming.html#_splitmix64',
+                                                                                    'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.n_images': ('streaming.html#n_images', 'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.read_shard': ( 'streaming.html#read_shard',
+                                                                                   'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.shuffled': ('streaming.html#shuffled', 'slow_diffusion/streaming.py'),
+                                          'slow_diffusion.streaming.write_shards': ( 'streaming.html#write_shards',
+                                                                                     'slow_diffusion/streaming.py')},
+            'slow_diffusion.timesteps': { 'slow_diffusion.timesteps.ImportanceSampler': ( 'timesteps.html#importancesampler',
+                                                                                          'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.ImportanceSampler.__init__': ( 'timesteps.html#importancesampler.__init__',
+                                                                                                   'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.ImportanceSampler.bins': ( 'timesteps.html#importancesampler.bins',
+                                                                                               'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.ImportanceSampler.probs': ( 'timesteps.html#importancesampler.probs',
+                                                                                                'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.ImportanceSampler.sample': ( 'timesteps.html#importancesampler.sample',
+                                                                                                 'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.ImportanceSampler.update': ( 'timesteps.html#importancesampler.update',
+                                                                                                 'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.ImportanceSampler.weights': ( 'timesteps.html#importancesampler.weights',
+                                                                                                  'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.StratifiedSampler': ( 'timesteps.html#stratifiedsampler',
+                                                                                          'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.StratifiedSampler.sample': ( 'timesteps.html#stratifiedsampler.sample',
+                                                                                                 'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.UniformSampler': ( 'timesteps.html#uniformsampler',
+                                                                                       'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.UniformSampler.sample': ( 'timesteps.html#uniformsampler.sample',
+                                                                                              'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.UniformSampler.update': ( 'timesteps.html#uniformsampler.update',
+                                                                                              'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.UniformSampler.weights': ( 'timesteps.html#uniformsampler.weights',
+                                                                                               'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.get_loss_weighting': ( 'timesteps.html#get_loss_weighting',
+                                                                                           'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.get_timestep_sampler': ( 'timesteps.html#get_timestep_sampler',
+                                                                                             'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.min_snr': ('timesteps.html#min_snr', 'slow_diffusion/timesteps.py'),
+                                          'slow_diffusion.timesteps.no_weighting': ( 'timesteps.html#no_weighting',
+                                                                                     'slow_diffusion/timesteps.py')},
             'slow_diffusion.training': { 'slow_diffusion.training.UnetLightning': ( 'training.html#unetlightning',
                                                                                     'slow_diffusion/training.py'),
                                          'slow_diffusion.training.UnetLightning.__init__': ( 'training.html#unetlightning.__init__',
                                                                                              'slow_diffusion/training.py'),
                                          'slow_diffusion.training.UnetLightning.configure_optimizers': ( 'training.html#unetlightning.configure_optimizers',
                                                                                                          'slow_diffusion/training.py'),
+                                         'slow_diffusion.training.UnetLightning.on_after_batch_transfer': ( 'training.html#unetlightning.on_after_batch_transfer',
+                                                                                                            'slow_diffusion/training.py'),
+                                         'slow_diffusion.training.UnetLightning.on_fit_start': ( 'training.html#unetlightning.on_fit_start',
+                                                                                                 'slow_diffusion/training.py'),
+                                         'slow_diffusion.training.UnetLightning.on_load_checkpoint': ( 'training.html#unetlightning.on_load_checkpoint',
+                                                                                                       'slow_diffusion/training.py'),
+                                         'slow_diffusion.training.UnetLightning.on_save_checkpoint': ( 'training.html#unetlightning.on_save_checkpoint',
+                                                                                                       'slow_diffusion/training.py'),
                                          'slow_diffusion.training.UnetLightning.step': ( 'training.html#unetlightning.step',
                                                                                          'slow_diffusion/training.py'),
                                          'slow_diffusion.training.UnetLightning.training_step': ( 'training.html#unetlightning.training_step',
@@ -0,0 +1,13 @@
+"""Written by hand"""
+from lightning.pytorch.cli import LightningCLI
+
+from slow_diffusion.cli import CustomModelCheckpoint  # noqa: F401, used in configs
+from slow_diffusion.latent import AutoencoderLightning
+
+
+def autoencoder_main():
+    _ = LightningCLI(AutoencoderLightning, save_config_kwargs={"overwrite": True})
+
+
+if __name__ == "__main__":
+    autoencoder_main()
@@ -1,21 +1,34 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/02_data.ipynb.
 
 # %% auto 0
-__all__ = ['ᾱ', 'noisify', 'DiffusionDataModule']
+__all__ = ['NOISE_SCHEDULES', 'CACHE_VERSION', 'get_t_checking', 'set_t_checking', 't_checking', 'NoiseSchedule',
+           'CosineSchedule', 'LinearSchedule', 'get_noise_schedule', 'set_noise_schedule', 'noise_schedule', 'ᾱ',
+           'noisify', 'noisify_draws', 'philox4x32', 'seeded_randn', 'SeededBatch', 'noise_draws', 'noisify_batch',
+           'MemmapDataset', 'DiffusionDataModule']
 
 # %% ../nbs/02_data.ipynb 2
+import contextlib
+import functools
+import hashlib
+import inspect
 import itertools
 import math
 import multiprocessing
+import os
+import shutil
+import tempfile
 from pathlib import Path
+from typing import NamedTuple
 
 import lightning as L
 import matplotlib.pyplot as plt
+import numpy as np
 import torch
 import torchvision.transforms.functional as F
 from datasets import load_dataset, load_from_disk
 from einops import rearrange
-from torch.utils.data import DataLoader
+from torch import Tensor
+from torch.utils.data import DataLoader, Dataset
 
 # %% ../nbs/02_data.ipynb 3
 def show_images(imgs, titles=[], figsize=(4, 4)):
@@ -31,36 +44,324 @@ def show_images(imgs, titles=[], figsize=(4, 4)):
     return fig
 
 # %% ../nbs/02_data.ipynb 5
+_check_t = os.environ.get("SLOW_DIFFUSION_CHECK_T", "0") not in ("0", "false")
+
+
+def get_t_checking() -> bool:
+    return _check_t
+
+
+def set_t_checking(enabled: bool) -> bool:
+    """Turn checking that time steps are in [0, 1] (and on the grid of a
+    `TimeEmbeddingCache`) on or off, returning the previous setting. Every
+    check syncs the accelerator with the host"""
+    global _check_t
+    previous, _check_t = _check_t, enabled
+    return previous
+
+
+@contextlib.contextmanager
+def t_checking(enabled: bool):
+    """Turn time step checking on or off within this context"""
+    previous = set_t_checking(enabled)
+    try:
+        yield
+    finally:
+        set_t_checking(previous)
+
+
+class NoiseSchedule:
+    """ᾱ as a function of the time step t in [0, 1], and the coefficients
+    derived from it. Subclasses implement `_ᾱ`"""
+
+    def _ᾱ(self, t):
+        raise NotImplementedError
+
+    def ᾱ(self, t, reshape=True):
+        if _check_t:
+            assert (0 <= t).all() and (t <= 1).all()
+        ᾱ_ = self._ᾱ(t)
+        if reshape:
+            ᾱ_ = ᾱ_.reshape(-1, 1, 1, 1)
+        return ᾱ_
+
+    def α_σ(self, t, reshape=True):
+        """Scales of the signal and of the noise in x_t, from one evaluation
+        of ᾱ"""
+        ᾱ_ = self.ᾱ(t, reshape)
+        return ᾱ_.sqrt(), (1 - ᾱ_).sqrt()
+
+    def λ(self, t):
+        """Log signal-to-noise ratio"""
+        ᾱ_ = self.ᾱ(t)
+        return 0.5 * (ᾱ_.log() - (1 - ᾱ_).log())
+
+    def t_from_λ(self, λ_):
+        """Inverse of `λ`"""
+        raise NotImplementedError
+
+
+class CosineSchedule(NoiseSchedule):
+    """https://arxiv.org/abs/2102.09672"""
+
+    def _ᾱ(self, t):
+        return ((t * math.pi / 2).cos() ** 2).clamp(0.0, 0.999)
+
+    def t_from_λ(self, λ_):
+        return (2 / math.pi) * torch.sigmoid(2 * λ_).sqrt().arccos()
+
+
+class LinearSchedule(NoiseSchedule):
+    """Continuous time limit of the linear β schedule of DDPM
+    (https://arxiv.org/abs/2011.13456)"""
+
+    def __init__(self, β_min=0.1, β_max=20.0):
+        self.β_min = β_min
+        self.β_max = β_max
+
+    def _ᾱ(self, t):
+        log_ᾱ = -(self.β_min * t + (self.β_max - self.β_min) * t**2 / 2)
+        return log_ᾱ.exp().clamp(0.0, 0.999)
+
+    def t_from_λ(self, λ_):
+        # Root of the quadratic -log ᾱ(t) = -log sigmoid(2λ)
+        c = torch.nn.functional.softplus(-2 * λ_)
+        d = self.β_max - self.β_min
+        return ((self.β_min**2 + 2 * d * c).sqrt() - self.β_min) / d
+
+
+NOISE_SCHEDULES = {"cosine": CosineSchedule, "linear": LinearSchedule}
+
+_schedule = CosineSchedule()
+
+
+def get_noise_schedule():
+    return _schedule
+
+
+def set_noise_schedule(schedule: NoiseSchedule | str) -> NoiseSchedule:
+    """Noisify and denoise with `schedule`, or the schedule of that name,
+    returning the previous one"""
+    global _schedule
+    if isinstance(schedule, str):
+        try:
+            schedule = NOISE_SCHEDULES[schedule]()
+        except KeyError:
+            raise ValueError(
+                f"unknown noise schedule {schedule!r}, expected one of {list(NOISE_SCHEDULES)}"
+            )
+    previous, _schedule = _schedule, schedule
+    return previous
+
+
+@contextlib.contextmanager
+def noise_schedule(schedule: NoiseSchedule | str):
+    """Use `schedule` within this context"""
+    previous = set_noise_schedule(schedule)
+    try:
+        yield
+    finally:
+        set_noise_schedule(previous)
+
+
 def ᾱ(t, reshape=True):
-    assert (0 <= t).all() and (t <= 1).all()
-    ᾱ_ = ((t * math.pi / 2).cos() ** 2).clamp(0.0, 0.999)
-    if reshape:
-        ᾱ_ = ᾱ_.reshape(-1, 1, 1, 1)
-    return ᾱ_
-
-# %% ../nbs/02_data.ipynb 6
-def noisify(x_0, t=None):
+    return _schedule.ᾱ(t, reshape)
+
+# %% ../nbs/02_data.ipynb 7
+def noisify(x_0, t=None, ε=None, generator=None):
     n, *_ = x_0.shape
     device = x_0.device
 
     if t is None:
-        t = torch.rand((n,), device=device)
+        t = torch.rand((n,), device=device, generator=generator)
 
     # Sample 2D noise for each example in the batch
-    ε = torch.randn(x_0.shape, device=device)
+    if ε is None:
+        ε = torch.randn(x_0.shape, device=device, generator=generator)
 
     # Add noise according to the equation in Algorithm 1, such
     # that the variance of the distribution does not change. Also,
     # ensure that the overall magnitude does not change by 0-centering
     # x_0 and 0.5-centering x_t
-    x_t = ᾱ(t).sqrt() * (x_0) + (1 - ᾱ(t)).sqrt() * ε
+    α, σ = _schedule.α_σ(t)
+    x_t = α * x_0 + σ * ε
 
     return ((x_t, t), ε)
 
-# %% ../nbs/02_data.ipynb 7
+
+def noisify_draws(x_0, k=1, t=None, generator=None):
+    """Noisify every image of `x_0` `k` times, at time steps stratified over
+    [0, 1), so that each image is seen across the whole noise schedule. Or at
+    the time steps `t`, `k` per image"""
+    if k == 1:
+        return noisify(x_0, t, generator=generator)
+    n, *_ = x_0.shape
+    device = x_0.device
+    if t is None:
+        u = torch.rand((n, k), device=device, generator=generator)
+        t = (torch.arange(k, device=device) + u) / k
+    return noisify(x_0.repeat_interleave(k, dim=0), t.flatten(), generator=generator)
+
+# %% ../nbs/02_data.ipynb 10
+_M32 = 0xFFFFFFFF
+
+
+def _mulhilo32(a, b: int):
+    """High and low words of the 64-bit product of the 32-bit words `a` and
+    `b`, without overflowing int64"""
+    b_hi, b_lo = b >> 16, b & 0xFFFF
+    lo_lo, lo_hi = a * b_lo, a * b_hi
+    s = lo_lo + ((lo_hi & 0xFFFF) << 16)
+    return (lo_hi >> 16) + (s >> 32), s & _M32
+
+
+def philox4x32(counter, key, rounds=10):
+    """Philox4x32 block of four 32-bit words, for counters of four words and
+    keys of two words, each an int64 tensor"""
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    for i in range(rounds):
+        if i:
+            k0, k1 = (k0 + 0x9E3779B9) & _M32, (k1 + 0xBB67AE85) & _M32
+        hi0, lo0 = _mulhilo32(c0, 0xD2511F53)
+        hi1, lo1 = _mulhilo32(c2, 0xCD9E8D57)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+    return c0, c1, c2, c3
+
+
+def seeded_randn(seed, shape):
+    """Standard normal noise of `shape` for every int64 seed in `seed`, on the
+    device of `seed`"""
+    n, m = len(seed), math.prod(shape)
+    key = (seed & _M32)[:, None], (seed >> 32 & _M32)[:, None]
+    zero = torch.zeros((), dtype=torch.int64, device=seed.device)
+    block = torch.arange(math.ceil(m / 4), device=seed.device)[None, :]
+    words = philox4x32((block, zero, zero, zero), key)
+    # 24 bits per word, uniform on (0, 1)
+    u = [((w >> 8).float() + 0.5) * 2**-24 for w in words]
+    # Box-Muller, two normals from each pair of uniforms
+    normals = []
+    for u1, u2 in (u[:2], u[2:]):
+        r, θ = (-2 * u1.log()).sqrt(), 2 * math.pi * u2
+        normals += [r * θ.cos(), r * θ.sin()]
+    return torch.stack(normals, dim=-1).reshape(n, -1)[:, :m].reshape(n, *shape)
+
+# %% ../nbs/02_data.ipynb 13
+class SeededBatch(NamedTuple):
+    """uint8 images with the time steps and seeds to noisify them with"""
+
+    x_0: Tensor
+    t: Tensor
+    seed: Tensor
+
+
+def noise_draws(dm):
+    """How many times the data module `dm` noisifies every training image"""
+    return getattr(dm, "noise_draws_per_image", 1)
+
+
+def noisify_batch(batch, dm, t=None):
+    """Noisify the batches that the data module `dm` leaves to the
+    accelerator, see `noisify_on_device` and `seeded_validation`. Others are
+    passed through. The time steps of uint8 batches can be given as `t`"""
+    if isinstance(batch, SeededBatch):
+        x_0 = dm.normalize(batch.x_0)
+        return noisify(x_0, batch.t, seeded_randn(batch.seed, x_0.shape[1:]))
+    if isinstance(batch, Tensor):
+        return noisify_draws(dm.normalize(batch), noise_draws(dm), t)
+    return batch
+
+# %% ../nbs/02_data.ipynb 15
+class MemmapDataset(Dataset):
+    """Rows of one or more memory-mapped `.npy` arrays of the same length.
+    Batches are read with one fancy index per array rather than row by row"""
+
+    def __init__(self, *paths):
+        self.paths = [Path(p) for p in paths]
+        self._arrays = None
+
+    @property
+    def arrays(self):
+        # Opened lazily, so that workers map the files rather than unpickle
+        # a copy of them
+        if self._arrays is None:
+            self._arrays = [np.load(p, mmap_mode="r") for p in self.paths]
+        return self._arrays
+
+    def __getstate__(self):
+        return {**self.__dict__, "_arrays": None}
+
+    def __len__(self):
+        return len(self.arrays[0])
+
+    def __getitem__(self, i):
+        return tuple(torch.from_numpy(np.array(a[i])) for a in self.arrays)
+
+    def __getitems__(self, idxs):
+        # In file order, the order within a batch doesn't matter
+        idxs = np.sort(idxs)
+        return tuple(torch.from_numpy(a[idxs]) for a in self.arrays)
+
+
+def _create_npy(path, dtype, shape):
+    """Allocate a `.npy` array on disk, for processes to fill in with `mmap_mode="r+"`"""
+    np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape).flush()
+
+
+_map_fn = None
+
+
+def _call_map_fn(arg):
+    return _map_fn(arg)
+
+
+def _fork_map(fn, args, num_proc):
+    """`map(fn, args)` across `num_proc` forked processes. The processes
+    inherit `fn` rather than unpickle it, so it may close over anything"""
+    global _map_fn
+    if num_proc <= 1:
+        return list(map(fn, args))
+    _map_fn = fn
+    try:
+        with multiprocessing.get_context("fork").Pool(num_proc) as pool:
+            return pool.map(_call_map_fn, args)
+    finally:
+        _map_fn = None
+
+
+@contextlib.contextmanager
+def _atomic_dir(path):
+    """Empty directory to build `path` in, which is moved into place once the
+    context exits. An interrupted build leaves nothing behind, and concurrent
+    builds (e.g., one per DDP rank) each get their own; the first one to
+    finish wins"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}."))
+    try:
+        yield tmp_dir
+        try:
+            tmp_dir.rename(path)
+        except OSError:
+            if not path.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# %% ../nbs/02_data.ipynb 19
+# Bump when the layout of the cache changes
+CACHE_VERSION = 3
+
+
+def _source(fn):
+    try:
+        return inspect.getsource(fn)
+    except (OSError, TypeError):
+        return fn.__qualname__
+
+
 class DiffusionDataModule(L.LightningDataModule):
     """Lightning DataModule wrapper for huggingface datasets. Helps with
-    pre-processing the image data. Just add a noisify_fn(batch)!"""
+    pre-processing the image data. Just add a normalize(x_0)!"""
 
     def __init__(
         self,
@@ -69,6 +370,11 @@ class DiffusionDataModule(L.LightningDataModule):
         n_workers=0,
         img_size: tuple[int, int] | None = None,
         data_dir="./data",
+        noisify_on_device: bool = False,
+        seeded_validation: bool = False,
+        test_splits: tuple[str, ...] = ("test",),
+        num_proc: int | None = None,
+        noise_draws_per_image: int = 1,
     ):
         super().__init__()
         self.bs = bs
@@ -76,12 +382,27 @@ class DiffusionDataModule(L.LightningDataModule):
         self.img_size = img_size
         self._n_workers = n_workers
         self.data_dir = Path(data_dir)
+        # Ship training batches as uint8 images, for the model to normalize
+        # and noisify after they are on the accelerator
+        self.noisify_on_device = noisify_on_device
+        # Store a seed per validation image rather than its noise, for the
+        # model to regenerate the noise from on the accelerator
+        self.seeded_validation = seeded_validation
+        self.test_splits = tuple(test_splits)
+        # Processes to build the cache with, defaults to one per worker
+        self._num_proc = num_proc
+        # Noisify every training image this many times, so that a batch holds
+        # `bs * noise_draws_per_image` examples for the price of decoding `bs`
+        self.noise_draws_per_image = noise_draws_per_image
 
-    def noisify_fn(self, x_0):
-        # TODO: better to have subclasses provide a "normalized x_0" method
-        # and perform noisification consistent here in the super class...
+    def normalize(self, x_0):
+        """Convert a batch of uint8 images to the zero-centered floats that the
+        model is trained on"""
         raise NotImplementedError
 
+    def noisify_fn(self, x_0, k=1, generator=None):
+        return noisify_draws(self.normalize(x_0), k, generator=generator)
+
     def post_process(self, ds):
         """Optional post-processing pass after download but before freezing"""
         raise NotImplementedError
@@ -95,47 +416,162 @@ class DiffusionDataModule(L.LightningDataModule):
         assert w & (w - 1) == 0, f"width ({w}) must be a power of two"
         return x
 
+    def _fill(self, ds, paths, start, noisify=False):
+        """Decode the batch of `ds` at row `start` into the `.npy` arrays at
+        `paths`, as uint8 images or noisified"""
+        rows = slice(start, min(start + self.bs, len(ds)))
+        x_0 = torch.stack([self.to_tensor(img) for img in ds[rows]["image"]])
+        if noisify:
+            # Seeded per image by its position, so that the noise depends
+            # neither on the batch size nor on how the batches are spread
+            # across processes. Generators of their own rather than fork_rng,
+            # which would initialize CUDA in the fork
+            noised = [
+                self.noisify_fn(x[None], generator=torch.Generator().manual_seed(i))
+                for i, x in zip(range(rows.start, rows.stop), x_0)
+            ]
+            xs = [
+                torch.cat(x)
+                for x in zip(*((x_t, t, epsilon) for (x_t, t), epsilon in noised))
+            ]
+        else:
+            xs = (x_0,)
+        for path, x in zip(paths, xs):
+            a = np.load(path, mmap_mode="r+")
+            a[rows] = x.numpy()
+            a.flush()
+
+    def _fill_all(self, ds, paths, **kwargs):
+        starts = range(0, len(ds), self.bs)
+        fill = functools.partial(self._fill, ds, paths, **kwargs)
+        _fork_map(fill, starts, self.num_proc)
+
+    def _store(self, ds, path):
+        """Decode and resize every image of `ds` into one uint8 array"""
+        c, h, w = self.to_tensor(ds[0]["image"]).shape
+        _create_npy(path, np.uint8, (len(ds), c, h, w))
+        self._fill_all(ds, [path])
+
     def _collate(self, batch):
-        x_0 = torch.stack([self.to_tensor(row["image"]) for row in batch])
-        return self.noisify_fn(x_0)
+        (x_0,) = batch
+        if self.noisify_on_device:
+            return x_0
+        return self.noisify_fn(x_0, self.noise_draws_per_image)
+
+    def _freeze(self, ds, paths):
+        """Noisify every image of `ds` once, into fixed-shape float32 arrays"""
+        c, h, w = self.to_tensor(ds[0]["image"]).shape
+        shapes = [(len(ds), c, h, w), (len(ds),), (len(ds), c, h, w)]
+        for path, shape in zip(paths, shapes):
+            _create_npy(path, np.float32, shape)
+        self._fill_all(ds, paths, noisify=True)
+
+    def _freeze_seeds(self, ds, paths, seed=0):
+        """Store the uint8 images of `ds` with a time step and a noise seed each"""
+        x_0_path, t_path, seed_path = paths
+        self._store(ds, x_0_path)
+        rng = np.random.default_rng(seed)
+        np.save(t_path, rng.random(len(ds), dtype=np.float32))
+        np.save(seed_path, rng.integers(0, 2**63 - 1, len(ds)))
 
-    def _freeze(self, batch):
-        x_0 = torch.stack([self.to_tensor(img) for img in batch["image"]])
-        ((x_t, t), epsilon) = self.noisify_fn(x_0)
-        return {"x_t": x_t, "t": t, "epsilon": epsilon}
+    def _frozen_collate(self, batch):
+        x_t, t, epsilon = batch
+        return (x_t, t), epsilon
 
-    def _frozen_collate(self, rows):
-        def s(feature):
-            return torch.tensor([row[feature] for row in rows])
+    def _seeded_collate(self, batch):
+        return SeededBatch(*batch)
 
-        return (s("x_t"), s("t")), s("epsilon")
+    @property
+    def cache_key(self):
+        """Hash of everything the cache is computed from, so that changing any
+        of it builds a new cache rather than reusing a stale one"""
+        fns = (
+            self.load,
+            self.post_process,
+            self.to_tensor,
+            self.normalize,
+            self.noisify_fn,
+            noisify,
+            noisify_draws,
+            NoiseSchedule.ᾱ,
+            NoiseSchedule.α_σ,
+            type(_schedule)._ᾱ,
+        )
+        key = (
+            CACHE_VERSION,
+            self.__class__.__qualname__,
+            self.hf_ds_uri,
+            self.img_size,
+            self.test_splits,
+            self.seeded_validation,
+            vars(_schedule),
+            *(_source(fn) for fn in fns),
+        )
+        return hashlib.sha256(repr(key).encode()).hexdigest()[:16]
 
     @property
     def cached_dir(self):
-        return self.data_dir / f"{self.__class__.__name__}_{self.hf_ds_uri}"
+        name = f"{self.__class__.__name__}_{self.hf_ds_uri}_{self.cache_key}"
+        return self.data_dir / name
 
-    def clean(self):
-        self.cached_dir.unlink()
+    def clean_path(self, split):
+        """The uint8 images of `split`, before any noise"""
+        return self.cached_dir / f"{split}_x_0.npy"
+
+    @property
+    def x_0_path(self):
+        return self.clean_path("train")
 
-    def setup(self, stage: str | None = None, test_splits=("test",)):
-        if not self.cached_dir.exists():
-            ds = load_dataset(self.hf_ds_uri)
+    def frozen_paths(self, split):
+        return [self.cached_dir / f"{split}_{k}.npy" for k in ("x_t", "t", "epsilon")]
 
-            try:
-                ds = self.post_process(ds)
-            except NotImplementedError:
-                pass
+    def seeded_paths(self, split):
+        return [self.cached_dir / f"{split}_{k}.npy" for k in ("x_0", "t", "seed")]
 
-            for split in test_splits:
-                ds[split] = ds[split].map(
-                    self._freeze,
-                    batched=True,
-                    # We can discard the original data, as we only care about the noised information
-                    remove_columns=ds[split].features.keys(),
-                )
+    def clean(self):
+        shutil.rmtree(self.cached_dir)
+
+    def load(self):
+        """Download the dataset and apply `post_process`, without freezing"""
+        ds = load_dataset(self.hf_ds_uri)
+        try:
+            ds = self.post_process(ds)
+        except NotImplementedError:
+            pass
+        return ds
+
+    def _build(self, root):
+        ds = self.load()
+        # We can discard the original test data, as we only care about the
+        # noised information
+        frozen = {split: ds.pop(split) for split in self.test_splits}
+        ds.save_to_disk(root)
+        # Decode the training images once, rather than in every epoch, into a
+        # buffer that all workers share through the page cache
+        self._store(ds["train"], root / self.x_0_path.name)
+        for split, ds_ in frozen.items():
+            if self.seeded_validation:
+                paths = [root / p.name for p in self.seeded_paths(split)]
+                self._freeze_seeds(ds_, paths)
+            else:
+                paths = [root / p.name for p in self.frozen_paths(split)]
+                self._freeze(ds_, paths)
+                # Kept alongside the noise for consumers of the clean images,
+                # such as the autoencoder (seeded splits store them already)
+                self._store(ds_, root / self.clean_path(split).name)
 
-            ds.save_to_disk(self.cached_dir)
+    def prepare_data(self):
+        """Build the cache, unless it exists already"""
+        if self.cached_dir.exists():
+            return
+        with _atomic_dir(self.cached_dir) as root:
+            self._build(root)
 
+    def setup(self, stage: str | None = None, test_splits=None):
+        if test_splits is not None:
+            self.test_splits = tuple(test_splits)
+        # Lightning only prepares the data on one process per node
+        self.prepare_data()
         # Load from disk to take advantage of mmapping
         self.ds = load_from_disk(self.cached_dir)
 
@@ -146,9 +582,15 @@ class DiffusionDataModule(L.LightningDataModule):
         else:
             return self._n_workers
 
+    @property
+    def num_proc(self):
+        if self._num_proc is None:
+            return max(self.n_workers, 1)
+        return self._num_proc
+
     def train_dataloader(self):
         return DataLoader(
-            self.ds["train"],
+            MemmapDataset(self.x_0_path),
             shuffle=True,
             batch_size=self.bs,
             collate_fn=self._collate,
@@ -156,9 +598,15 @@ class DiffusionDataModule(L.LightningDataModule):
         )
 
     def val_dataloader(self):
+        if self.seeded_validation:
+            ds = MemmapDataset(*self.seeded_paths("test"))
+            collate_fn = self._seeded_collate
+        else:
+            ds = MemmapDataset(*self.frozen_paths("test"))
+            collate_fn = self._frozen_collate
         return DataLoader(
-            self.ds["test"],
+            ds,
             batch_size=self.bs,
-            collate_fn=self._frozen_collate,
+            collate_fn=collate_fn,
             num_workers=self.n_workers,
         )
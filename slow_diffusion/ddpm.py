@@ -1,62 +1,435 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/04_ddpm.ipynb.
 
 # %% auto 0
-__all__ = ['denoisify', 'ddpm', 'DDPMCallback']
+__all__ = ['SAMPLERS', 'denoisify', 'denoisify_with', 'time_embedding_cache', 'set_progress_bars', 'progress_bars', 'ddpm',
+           'ddim_step', 'ddim_step_with', 'ddim', 'λ', 'dpm_solver_pp', 'heun', 'get_sampler', 't_from_λ', 'adaptive',
+           'picard', 'compile_for_sampling', 'DDPMCallback']
 
 # %% ../nbs/04_ddpm.ipynb 2
+import math
+import warnings
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
 import lightning as L
 import torch
 import wandb
 from lightning.pytorch.loggers import WandbLogger
-from torch import tensor
 from tqdm import tqdm
 
-from .data import noisify, show_images, ᾱ
+from .data import get_noise_schedule, show_images, ᾱ
 from .fashionmnist import TinyFashionMNISTDataModule
+from .model import Unet, _preserved_batchnorm_stats
 from .training import get_tiny_unet_lightning
 
 # %% ../nbs/04_ddpm.ipynb 3
 def denoisify(x_t, noise, t):
-    return (x_t - (1 - ᾱ(t)).sqrt() * noise) / ᾱ(t).sqrt()
+    return denoisify_with(x_t, noise, *get_noise_schedule().α_σ(t))
+
+
+def denoisify_with(x_t, noise, α, σ):
+    """`denoisify`, given the scales α and σ of the signal and of the noise at
+    the time step rather than the time step itself"""
+    return (x_t - σ * noise) / α
 
 # %% ../nbs/04_ddpm.ipynb 4
-@torch.no_grad()
-def ddpm(model, sz, n_steps, device=None):
+def time_embedding_cache(model, ts):
+    """Tabulate the time embeddings for the time steps in `ts` while sampling,
+    see `TimeEmbeddingCache`. This requires the model to be in eval mode, so
+    this is a no-op in training mode"""
+    if isinstance(model, Unet) and not model.training:
+        return model.cached_time_embeddings(ts)
+    return nullcontext()
+
+
+def _memory_format(model):
+    """Layout that `model` expects its input in, so that the sampler's own
+    arithmetic on x_t does not mix layouts"""
+    return getattr(model, "memory_format", torch.contiguous_format)
+
+
+_progress_bars = True
+
+
+def set_progress_bars(enabled: bool) -> bool:
+    """Turn the samplers' progress bars on or off, returning the previous setting"""
+    global _progress_bars
+    previous, _progress_bars = _progress_bars, enabled
+    return previous
+
+
+@contextmanager
+def progress_bars(enabled: bool):
+    """Turn the samplers' progress bars on or off within this context"""
+    previous = set_progress_bars(enabled)
+    try:
+        yield
+    finally:
+        set_progress_bars(previous)
+
+
+def _progress(steps=None, **kwargs):
+    return tqdm(steps, unit="time step", disable=not _progress_bars, **kwargs)
+
+
+def _start(sz, n_steps, device=None, ts=None, memory_format=torch.contiguous_format):
+    """Initial noise, the decreasing grid of time steps to visit and the scales
+    α and σ of the signal and of the noise at each of them, so that the steps
+    index into a table rather than evaluate the noise schedule"""
+    if ts is None:
+        ts = torch.linspace(1 - (1 / n_steps), 0, n_steps)
+    ts = torch.as_tensor(ts, dtype=torch.float)
     x_t = torch.randn(sz)
-    ts = torch.linspace(1 - (1 / n_steps), 0, n_steps)
-    bs, *_ = x_t.shape
     if device:
         x_t = x_t.to(device)
         ts = ts.to(device)
-    for t, t_next in tqdm(zip(ts, ts[1:]), unit="time step", total=n_steps - 1):
-        t = t.repeat(bs)
-        t_next = t_next.repeat(bs)
-        noise_pred = model(x_t, t)
-        x_0_pred = denoisify(x_t, noise_pred, t)
-        (prev_sample, _), _ = noisify(x_0_pred, t_next)
-        x_t = prev_sample
-
-    t = tensor(0.0, device=device).repeat(bs)
+    αs, σs = get_noise_schedule().α_σ(ts)
+    return x_t.contiguous(memory_format=memory_format), ts, αs, σs
+
+# %% ../nbs/04_ddpm.ipynb 5
+@torch.no_grad()
+def ddpm(model, sz, n_steps, device=None):
+    x_t, ts, αs, σs = _start(sz, n_steps, device, memory_format=_memory_format(model))
+    bs, *_ = x_t.shape
+    with time_embedding_cache(model, ts):
+        for i, t in _progress(enumerate(ts[:-1]), total=n_steps - 1):
+            noise_pred = model(x_t, t.repeat(bs))
+            x_0_pred = denoisify_with(x_t, noise_pred, αs[i], σs[i])
+            # Re-noise to the next time step with fresh noise
+            ε = torch.randn(x_0_pred.shape, device=x_0_pred.device)
+            x_t = αs[i + 1] * x_0_pred + σs[i + 1] * ε
+
+        t = ts[-1].repeat(bs)
+        x_0 = denoisify_with(x_t, model(x_t, t), αs[-1], σs[-1])
+
+    return x_0
+
+# %% ../nbs/04_ddpm.ipynb 8
+def ddim_step(x_t, noise_pred, t, t_next, eta=0.0):
+    """Move x_t from time step t to t_next. eta=0 is fully deterministic,
+    larger values inject fresh noise in proportion to the step size"""
+    schedule = get_noise_schedule()
+    α_σ, α_σ_next = schedule.α_σ(t), schedule.α_σ(t_next)
+    return ddim_step_with(x_t, noise_pred, *α_σ, *α_σ_next, eta=eta)
+
+
+def ddim_step_with(x_t, noise_pred, α, σ, α_next, σ_next, eta=0.0):
+    """`ddim_step`, given the scales of the signal and of the noise at both
+    time steps, e.g. from the table of a sampler's time steps"""
+    x_0_pred = denoisify_with(x_t, noise_pred, α, σ)
+    if eta == 0:
+        return α_next * x_0_pred + σ_next * noise_pred
+    s = eta * σ_next / σ * (1 - (α / α_next) ** 2).clamp(0).sqrt()
+    x_next = α_next * x_0_pred + (σ_next**2 - s**2).clamp(0).sqrt() * noise_pred
+    return x_next + s * torch.randn_like(x_t)
+
+# %% ../nbs/04_ddpm.ipynb 9
+@torch.no_grad()
+def ddim(model, sz, n_steps, device=None, eta=0.0, ts=None):
+    """DDIM sampler. `ts` are the (decreasing) time steps to visit, and default
+    to the same evenly spaced grid as `ddpm`"""
+    x_t, ts, αs, σs = _start(sz, n_steps, device, ts, _memory_format(model))
+    bs, *_ = x_t.shape
+    with time_embedding_cache(model, ts):
+        for i, t in _progress(enumerate(ts[:-1]), total=len(ts) - 1):
+            noise_pred = model(x_t, t.repeat(bs))
+            α_σs = αs[i], σs[i], αs[i + 1], σs[i + 1]
+            x_t = ddim_step_with(x_t, noise_pred, *α_σs, eta=eta)
+
+        t = ts[-1].repeat(bs)
+        x_0 = denoisify_with(x_t, model(x_t, t), αs[-1], σs[-1])
+
+    return x_0
+
+# %% ../nbs/04_ddpm.ipynb 14
+def λ(t):
+    """Log signal-to-noise ratio"""
+    return get_noise_schedule().λ(t)
+
+# %% ../nbs/04_ddpm.ipynb 15
+@torch.no_grad()
+def dpm_solver_pp(model, sz, n_steps, device=None, order=2, ts=None):
+    """Multistep DPM-Solver++ (https://arxiv.org/abs/2211.01095)"""
+    assert order in (1, 2, 3)
+    x_t, ts, αs, σs = _start(sz, n_steps, device, ts, _memory_format(model))
+    bs, *_ = x_t.shape
+    # ᾱ is clamped near t=0, so steps there don't move in λ and would make
+    # the extrapolation divide by zero
+    λs = (αs / σs).log().flatten()
+    keep = torch.cat([λs[:-1] < λs[1:], torch.ones_like(λs[-1:], dtype=torch.bool)])
+    ts, λs, αs, σs = ts[keep], λs[keep], αs[keep], σs[keep]
+    n = len(ts) - 1
+    x_0_preds, hs = [], []
+    with time_embedding_cache(model, ts):
+        for i, t in _progress(enumerate(ts[:-1]), total=n):
+            noise_pred = model(x_t, t.repeat(bs))
+            x_0_preds.insert(0, denoisify_with(x_t, noise_pred, αs[i], σs[i]))
+            del x_0_preds[order:]
+            h = λs[i + 1] - λs[i]
+            # (e^-h - 1), common to all orders
+            φ = torch.expm1(-h)
+            α_next = αs[i + 1]
+            σ_ratio = σs[i + 1] / σs[i]
+            x_t = σ_ratio * x_t - α_next * φ * x_0_preds[0]
+
+            order_ = min(order, i + 1, n - i)
+            if order_ >= 2:
+                m0, m1 = x_0_preds[:2]
+                r0 = hs[0] / h
+                D1_0 = (m0 - m1) / r0
+                if order_ == 2:
+                    x_t = x_t - 0.5 * α_next * φ * D1_0
+                else:
+                    m2 = x_0_preds[2]
+                    r1 = hs[1] / h
+                    D1_1 = (m1 - m2) / r1
+                    D1 = D1_0 + r0 / (r0 + r1) * (D1_0 - D1_1)
+                    D2 = (D1_0 - D1_1) / (r0 + r1)
+                    x_t = (
+                        x_t
+                        + α_next * (φ / h + 1) * D1
+                        - α_next * ((φ + h) / h**2 - 0.5) * D2
+                    )
+            hs.insert(0, h)
+            del hs[order:]
+
+        t = ts[-1].repeat(bs)
+        x_0 = denoisify_with(x_t, model(x_t, t), αs[-1], σs[-1])
+
+    return x_0
+
+# %% ../nbs/04_ddpm.ipynb 17
+@torch.no_grad()
+def heun(model, sz, n_steps, device=None, ts=None):
+    """Second order Heun sampler. Uses 2 * (n_steps - 1) + 1 model evaluations"""
+    x_t, ts, αs, σs = _start(sz, n_steps, device, ts, _memory_format(model))
+    bs, *_ = x_t.shape
+    with time_embedding_cache(model, ts):
+        for i, t in _progress(enumerate(ts[:-1]), total=len(ts) - 1):
+            α_σs = αs[i], σs[i], αs[i + 1], σs[i + 1]
+            noise_pred = model(x_t, t.repeat(bs))
+            x_euler = ddim_step_with(x_t, noise_pred, *α_σs)
+            noise_pred_next = model(x_euler, ts[i + 1].repeat(bs))
+            x_t = ddim_step_with(x_t, (noise_pred + noise_pred_next) / 2, *α_σs)
+
+        t = ts[-1].repeat(bs)
+        x_0 = denoisify_with(x_t, model(x_t, t), αs[-1], σs[-1])
+
+    return x_0
+
+# %% ../nbs/04_ddpm.ipynb 19
+SAMPLERS = {
+    "ddpm": ddpm,
+    "ddim": ddim,
+    "heun": heun,
+    "dpm++1": partial(dpm_solver_pp, order=1),
+    "dpm++2m": partial(dpm_solver_pp, order=2),
+    "dpm++3m": partial(dpm_solver_pp, order=3),
+}
+
+
+def get_sampler(name):
+    try:
+        return SAMPLERS[name]
+    except KeyError:
+        raise ValueError(f"unknown sampler {name!r}, expected one of {list(SAMPLERS)}")
+
+# %% ../nbs/04_ddpm.ipynb 26
+def t_from_λ(λ_):
+    """Inverse of `λ`"""
+    return get_noise_schedule().t_from_λ(λ_)
+
+# %% ../nbs/04_ddpm.ipynb 27
+@torch.no_grad()
+def adaptive(
+    model,
+    sz,
+    n_steps=10,
+    device=None,
+    tol=0.05,
+    atol=1 / 255,
+    info=None,
+    max_nfe=1000,
+):
+    """Adaptive step size sampler (https://arxiv.org/abs/2206.00927). `tol` and
+    `atol` are the relative and absolute local error tolerances. `n_steps` sets
+    the starting time step and the size of the first step, like in the other
+    samplers. Raises if the steps take more than `max_nfe` function
+    evaluations. Pass a dict as `info` to collect the number of function
+    evaluations and of accepted and rejected steps."""
+    x_t, ts, *_ = _start(sz, n_steps, device, memory_format=_memory_format(model))
+    bs, *_ = x_t.shape
+    λ_s, λ_end = λ(ts[0]).item(), λ(ts[-1]).item()
+    h = (λ_end - λ_s) / max(n_steps - 1, 1)
+    stats = {"nfe": 0, "n_accepted": 0, "n_rejected": 0}
+
+    def x_0_pred(x, λ_):
+        stats["nfe"] += 1
+        t = t_from_λ(torch.tensor(λ_, device=x.device)).repeat(bs)
+        return denoisify(x, model(x, t), t)
+
+    def α_σ(λ_):
+        ᾱ_ = 1 / (1 + math.exp(-2 * λ_))
+        return math.sqrt(ᾱ_), math.sqrt(1 - ᾱ_)
+
+    x_0_s = x_0_pred(x_t, λ_s)
+    while λ_end - λ_s > 1e-5:
+        if stats["nfe"] >= max_nfe:
+            raise RuntimeError(
+                f"the adaptive sampler used up its {max_nfe} function "
+                f"evaluations, stopping at λ={λ_s:.3f} of {λ_end:.3f}"
+            )
+        h = min(h, λ_end - λ_s)
+        (α_s, σ_s), (α_mid, σ_mid), (α_t, σ_t) = map(α_σ, (λ_s, λ_s + h / 2, λ_s + h))
+        x_low = σ_t / σ_s * x_t - α_t * math.expm1(-h) * x_0_s
+        u = σ_mid / σ_s * x_t - α_mid * math.expm1(-h / 2) * x_0_s
+        x_0_mid = x_0_pred(u, λ_s + h / 2)
+        x_high = σ_t / σ_s * x_t - α_t * math.expm1(-h) * x_0_mid
+
+        δ = (tol * torch.maximum(x_low.abs(), x_t.abs())).clamp(min=atol)
+        E = ((x_high - x_low) / δ).pow(2).flatten(1).mean(1).sqrt().max().item()
+        # Otherwise the step size would stay NaN and the loop never end
+        if not math.isfinite(E):
+            raise RuntimeError(f"the model output isn't finite at λ={λ_s:.3f}")
+        if E <= 1:
+            stats["n_accepted"] += 1
+            x_t, λ_s = x_high, λ_s + h
+            if λ_end - λ_s > 1e-5:
+                x_0_s = x_0_pred(x_t, λ_s)
+        else:
+            stats["n_rejected"] += 1
+        h = 0.9 * h * max(E, 1e-4) ** -0.5
+
+    t = ts[-1].repeat(bs)
     x_0 = denoisify(x_t, model(x_t, t), t)
+    stats["nfe"] += 1
+
+    if info is not None:
+        info.update(stats)
+    return x_0
+
+# %% ../nbs/04_ddpm.ipynb 32
+SAMPLERS["adaptive"] = adaptive
+
+# %% ../nbs/04_ddpm.ipynb 34
+@torch.no_grad()
+def picard(model, sz, n_steps, device=None, window=8, tol=1e-3, info=None):
+    """Parallel-in-time DDIM sampler. Converges to the same result as `ddim`
+    (with `eta=0`), up to `tol` RMS error per step. Pass a dict as `info` to
+    collect the number of Picard iterations and function evaluations."""
+    x_t, ts, αs, σs = _start(sz, n_steps, device, memory_format=_memory_format(model))
+    bs, *_ = x_t.shape
+    n = len(ts) - 1
+    # Initial guess: the trajectory stays at the noise it starts from
+    traj = x_t.repeat(n + 1, *(1 for _ in sz)).reshape(n + 1, *sz)
+    stats = {"iterations": 0, "nfe": 0}
+    j = 0
+    with time_embedding_cache(model, ts):
+        pbar = _progress(total=n)
+        while j < n:
+            end = min(j + window, n)
+            w = end - j
+            xs = traj[j:end].flatten(0, 1)
+            t = ts[j:end].repeat_interleave(bs)
+            # The coefficients of every example's time step
+            now, next_ = slice(j, end), slice(j + 1, end + 1)
+            α_σs = (αs[now], σs[now], αs[next_], σs[next_])
+            α_σs = (c.repeat_interleave(bs, 0) for c in α_σs)
+            drift = ddim_step_with(xs, model(xs, t), *α_σs) - xs
+            update = traj[j] + drift.reshape(w, *sz).cumsum(0)
+            err = (update - traj[j + 1 : end + 1]).pow(2).flatten(2).mean(2)
+            err = err.max(1).values.sqrt()
+            traj[j + 1 : end + 1] = update
+            stats["iterations"] += 1
+            stats["nfe"] += w
 
+            # x_{j+1} only depended on x_j, so it is exact after one iteration.
+            # The first step still moving, found on the device so that the
+            # window costs a single sync
+            diverged = err > tol
+            stride = torch.where(diverged.any(), diverged.int().argmax(), w)
+            stride = max(stride.item(), 1)
+            # Start the steps entering the window from the latest estimate
+            traj[end + 1 : min(end + stride, n) + 1] = traj[end]
+            j += stride
+            pbar.update(stride)
+        pbar.close()
+
+        t = ts[-1].repeat(bs)
+        x_0 = denoisify_with(traj[n], model(traj[n], t), αs[-1], σs[-1])
+        stats["nfe"] += 1
+
+    if info is not None:
+        info.update(stats)
     return x_0
 
-# %% ../nbs/04_ddpm.ipynb 6
+# %% ../nbs/04_ddpm.ipynb 39
+SAMPLERS["picard"] = picard
+
+# %% ../nbs/04_ddpm.ipynb 41
+def compile_for_sampling(
+    model, sz, device=None, mode=None, dynamic=None, backend="inductor"
+):
+    """`torch.compile` wrapper of `model` for the samplers, warmed up on a batch
+    of shape `sz`. `model` itself stays eager, and is returned if compilation
+    fails"""
+    compiled = torch.compile(model, mode=mode, dynamic=dynamic, backend=backend)
+    x_t = torch.randn(sz, device=device).contiguous(memory_format=_memory_format(model))
+    t = torch.rand(sz[0], device=device)
+    try:
+        with torch.no_grad(), _preserved_batchnorm_stats(model):
+            compiled(x_t, t)
+    except Exception as e:
+        warnings.warn(f"Compilation failed, sampling in eager mode: {e}")
+        return model
+    return compiled
+
+# %% ../nbs/04_ddpm.ipynb 43
 class DDPMCallback(L.Callback):
-    def __init__(self, n_imgs=4, n_steps=100):
+    def __init__(
+        self,
+        n_imgs=4,
+        n_steps=100,
+        sampler="ddpm",
+        compile: bool = False,
+        compile_mode: str | None = None,
+        compile_dynamic: bool | None = None,
+    ):
         super().__init__()
         self.n_imgs = n_imgs
         self.n_steps = n_steps
+        self.sampler = get_sampler(sampler)
+        # Sample with a `compile_for_sampling` wrapper of the U-Net, compiled
+        # once and kept for as long as the U-Net is
+        self.compile = compile
+        self.compile_mode = compile_mode
+        self.compile_dynamic = compile_dynamic
+        self._compiled = None
 
-    def on_train_epoch_end(self, trainer, pl_module):
+    def model(self, pl_module, sz):
+        unet = pl_module.unet
+        if not self.compile:
+            return unet
+        if self._compiled is None or self._compiled[0] is not unet:
+            compiled = compile_for_sampling(
+                unet,
+                sz,
+                device=pl_module.device,
+                mode=self.compile_mode,
+                dynamic=self.compile_dynamic,
+            )
+            self._compiled = unet, compiled
+        return self._compiled[1]
+
+    def sample(self, trainer, pl_module):
         sz = (
             self.n_imgs,
             pl_module.hparams.color_channels,
             *trainer.datamodule.img_size,
         )
-        x_0 = (
-            ddpm(pl_module.unet, sz, self.n_steps, device=pl_module.device)
-            .cpu()
-            .numpy()
-        )
+        model = self.model(pl_module, sz)
+        return self.sampler(model, sz, self.n_steps, device=pl_module.device)
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        x_0 = self.sample(trainer, pl_module).cpu().numpy()
         wandb.log({"samples": show_images(x_0)})
@@ -0,0 +1,13 @@
+"""Written by hand"""
+from lightning.pytorch.cli import LightningCLI
+
+from slow_diffusion.cli import CustomModelCheckpoint  # noqa: F401, used in configs
+from slow_diffusion.distillation import DistillationLightning
+
+
+def distill_main():
+    _ = LightningCLI(DistillationLightning, save_config_kwargs={"overwrite": True})
+
+
+if __name__ == "__main__":
+    distill_main()
@@ -0,0 +1,152 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/07_distillation.ipynb.
+
+# %% auto 0
+__all__ = ['distillation_target', 'DistillationLightning', 'DistillationDDPMCallback']
+
+# %% ../nbs/07_distillation.ipynb 2
+import copy
+
+import fsspec
+import lightning as L
+import torch
+from beartype import beartype
+
+from .data import get_noise_schedule, noisify
+from .ddpm import DDPMCallback, ddim_step
+from .fashionmnist import TinyFashionMNISTDataModule
+from .training import UnetLightning, get_tiny_unet_lightning
+
+# %% ../nbs/07_distillation.ipynb 5
+@torch.no_grad()
+def distillation_target(teacher, z_t, t, t_next):
+    """Noise prediction that takes z_t to where two teacher DDIM steps
+    between t and t_next end up, in one DDIM step"""
+    t_mid = (t + t_next) / 2
+    noise_pred = teacher(z_t, t)
+    z_mid = ddim_step(z_t, noise_pred, t, t_mid)
+    z_next = ddim_step(z_mid, teacher(z_mid, t_mid), t_mid, t_next)
+
+    schedule = get_noise_schedule()
+    α, σ = schedule.α_σ(t)
+    α_next, σ_next = schedule.α_σ(t_next)
+    denom = α_next - σ_next / σ * α
+    x_0 = (z_next - σ_next / σ * z_t) / denom
+    target = (z_t - α * x_0) / σ
+    return torch.where(denom.abs() > 1e-6, target, noise_pred)
+
+# %% ../nbs/07_distillation.ipynb 9
+class DistillationLightning(UnetLightning):
+    @beartype
+    def __init__(
+        self,
+        teacher_ckpt: str | None = None,
+        teacher_steps: int = 128,
+        min_student_steps: int = 4,
+        epochs_per_round: int = 5,
+        **kwargs,
+    ):
+        """Progressive distillation of a `UnetLightning` checkpoint
+
+        Args:
+            teacher_ckpt: Checkpoint of the teacher. Its architecture must
+                match the one specified in `kwargs`
+            teacher_steps: Number of sampling steps of the initial teacher
+            min_student_steps: Stop halving once the student reaches this
+                number of sampling steps
+            epochs_per_round: Epochs to train each student for
+            kwargs: `UnetLightning` arguments
+        """
+        super().__init__(**kwargs)
+        self.save_hyperparameters()
+        self.teacher = copy.deepcopy(self.unet).requires_grad_(False).eval()
+        if teacher_ckpt is not None:
+            # The hyperparameters include classes, so this can't be weights_only
+            with fsspec.open(teacher_ckpt, "rb") as f:
+                ckpt = torch.load(f, map_location="cpu", weights_only=False)
+            state = {
+                k.removeprefix("unet."): v
+                for k, v in ckpt["state_dict"].items()
+                if k.startswith("unet.")
+            }
+            self.unet.load_state_dict(state)
+            self.teacher.load_state_dict(state)
+        self.student_steps = teacher_steps // 2
+
+    def train(self, mode=True):
+        super().train(mode)
+        self.teacher.eval()
+        return self
+
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        if not self.trainer.training:
+            return super().on_after_batch_transfer(batch, dataloader_idx)
+        # The targets come from the teacher, so training batches are the
+        # clean images rather than noisified ones
+        if not isinstance(batch, torch.Tensor):
+            raise ValueError(
+                "distillation needs uint8 training batches, see `noisify_on_device`"
+            )
+        x_0 = self.trainer.datamodule.normalize(batch)
+        return x_0.contiguous(memory_format=self.unet.memory_format)
+
+    def training_step(self, x_0, batch_idx):
+        n, *_ = x_0.shape
+
+        # Student steps go from i/N to (i-1)/N, see `ddim`
+        i = torch.randint(1, self.student_steps, (n,), device=self.device)
+        t = i / self.student_steps
+        t_next = (i - 1) / self.student_steps
+        (z_t, _), _ = noisify(x_0, t)
+        target = distillation_target(self.teacher, z_t, t, t_next)
+
+        loss = self.loss_fn(self.unet(z_t, t), target)
+        self.log("train_loss", loss, on_step=True, sync_dist=True)
+        self.log("student_steps", float(self.student_steps), on_step=True)
+        return loss
+
+    def on_train_epoch_end(self):
+        if (self.current_epoch + 1) % self.hparams.epochs_per_round != 0:
+            return
+        if self.student_steps // 2 < self.hparams.min_student_steps:
+            return
+        self.teacher.load_state_dict(self.unet.state_dict())
+        self.student_steps //= 2
+
+    def on_save_checkpoint(self, checkpoint):
+        super().on_save_checkpoint(checkpoint)
+        checkpoint["student_steps"] = self.student_steps
+
+    def on_load_checkpoint(self, checkpoint):
+        super().on_load_checkpoint(checkpoint)
+        self.student_steps = checkpoint["student_steps"]
+
+    def configure_optimizers(self):
+        optimizer = torch.optim.AdamW(
+            (p for p in self.parameters() if p.requires_grad),
+            lr=self.hparams.lr,
+            eps=self.hparams.adamw_epsilon,
+        )
+        steps_per_epoch = self.trainer.estimated_stepping_batches / max(
+            self.trainer.max_epochs, 1
+        )
+        steps_per_round = max(int(steps_per_epoch * self.hparams.epochs_per_round), 1)
+        return {
+            "optimizer": optimizer,
+            "lr_scheduler": {
+                "scheduler": torch.optim.lr_scheduler.LambdaLR(
+                    optimizer,
+                    lambda step: 1 - (step % steps_per_round) / steps_per_round,
+                ),
+                "interval": "step",
+                "frequency": 1,
+            },
+        }
+
+# %% ../nbs/07_distillation.ipynb 11
+class DistillationDDPMCallback(DDPMCallback):
+    def __init__(self, n_imgs=4, sampler="ddim"):
+        super().__init__(n_imgs=n_imgs, sampler=sampler)
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        self.n_steps = pl_module.student_steps
+        super().on_train_epoch_end(trainer, pl_module)
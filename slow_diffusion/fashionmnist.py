@@ -8,28 +8,42 @@ import lightning as L
 import torch
 import torchvision.transforms.functional as F
 
-from .data import DiffusionDataModule, noisify, show_images
+from .data import DiffusionDataModule, show_images
 from .training import UnetLightning
 
 # %% ../nbs/03_fashion_mnist.ipynb 3
 class FashionMNISTDataModule(DiffusionDataModule):
     """Fasion MNIST datamodule"""
 
-    def __init__(self, bs, n_workers=0):
+    def __init__(
+        self,
+        bs,
+        n_workers=0,
+        noisify_on_device=False,
+        seeded_validation=False,
+        data_dir="./data",
+        num_proc=None,
+        noise_draws_per_image=1,
+    ):
         super().__init__(
             "fashion_mnist",
             bs,
             n_workers,
             img_size=(32, 32),
+            data_dir=data_dir,
+            noisify_on_device=noisify_on_device,
+            seeded_validation=seeded_validation,
+            num_proc=num_proc,
+            noise_draws_per_image=noise_draws_per_image,
         )
 
-    def noisify_fn(self, x_0):
+    def normalize(self, x_0):
         x_0 = F.convert_image_dtype(x_0, torch.float)
         # zero-center so that the mean does not change after adding noise
         x_0 -= 0.5
-        return noisify(x_0)
+        return x_0
 
-# %% ../nbs/03_fashion_mnist.ipynb 10
+# %% ../nbs/03_fashion_mnist.ipynb 18
 class TinyFashionMNISTDataModule(FashionMNISTDataModule):
     def post_process(self, ds):
-        return ds["train"].select(range(100)).train_test_split(test_size=0.5)
+        return ds["train"].select(range(100)).train_test_split(test_size=0.5, seed=0)
@@ -0,0 +1,209 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/08_inference.ipynb.
+
+# %% auto 0
+__all__ = ['fold_bn_into_conv', 'fold_bn_into_linear', 'fold_bn_into_mixer', 'ChannelAffine', 'fuse_for_inference',
+           'quantize_static', 'denoising_mse', 'export_onnx', 'OnnxUnet']
+
+# %% ../nbs/08_inference.ipynb 2
+import copy
+import inspect
+import itertools
+
+import torch
+import torch.ao.quantization as tq
+from torch import nn
+from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from slow_diffusion.model import (
+    NonPreactResBlock,
+    PreactConvBlock,
+    PreactResBlock,
+    TimeEmbeddingMixer,
+    TimeEmbeddingMLP,
+    Unet,
+    typechecking,
+)
+
+# %% ../nbs/08_inference.ipynb 5
+def _bn_scale_shift(bn: nn.modules.batchnorm._BatchNorm):
+    """Per-channel scale and shift equivalent to `bn` in eval mode"""
+    scale = (bn.running_var + bn.eps).rsqrt()
+    if bn.affine:
+        scale = scale * bn.weight
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        shift = shift + bn.bias
+    return scale, shift
+
+
+@torch.no_grad()
+def fold_bn_into_conv(conv: nn.Conv2d, bn: nn.BatchNorm2d):
+    """Fold `bn`, which follows `conv`, into the weights and bias of `conv`"""
+    scale, shift = _bn_scale_shift(bn)
+    bias = shift if conv.bias is None else conv.bias * scale + shift
+    conv.weight.mul_(scale[:, None, None, None])
+    conv.bias = nn.Parameter(bias)
+
+
+@torch.no_grad()
+def fold_bn_into_linear(bn: nn.BatchNorm1d, lin: nn.Linear):
+    """Fold `bn`, which precedes `lin`, into the weights and bias of `lin`"""
+    scale, shift = _bn_scale_shift(bn)
+    bias = lin.weight @ shift
+    if lin.bias is not None:
+        bias = bias + lin.bias
+    lin.weight.mul_(scale[None, :])
+    lin.bias = nn.Parameter(bias)
+
+# %% ../nbs/08_inference.ipynb 7
+@torch.no_grad()
+def fold_bn_into_mixer(mixer: TimeEmbeddingMixer, bn: nn.BatchNorm2d):
+    """Fold `bn`, which follows `mixer`, into the modulation of `mixer`"""
+    a, b = _bn_scale_shift(bn)
+    w_scale, w_shift = mixer.lin.weight.chunk(2)
+    b_scale, b_shift = mixer.lin.bias.chunk(2)
+    w_scale.mul_(a[:, None])
+    b_scale.mul_(a).add_(a - 1)
+    w_shift.mul_(a[:, None])
+    b_shift.mul_(a).add_(b)
+
+
+class ChannelAffine(nn.Module):
+    """Per-channel `x * scale + shift`, what an eval mode BatchNorm2d amounts to"""
+
+    def __init__(self, scale, shift):
+        super().__init__()
+        self.register_buffer("scale", scale[:, None, None].detach().clone())
+        self.register_buffer("shift", shift[:, None, None].detach().clone())
+
+    @classmethod
+    def from_batchnorm(cls, bn: nn.BatchNorm2d):
+        return cls(*_bn_scale_shift(bn))
+
+    def forward(self, x):
+        return torch.addcmul(self.shift, x, self.scale)
+
+# %% ../nbs/08_inference.ipynb 8
+def fuse_for_inference(unet: Unet) -> Unet:
+    """Copy of `unet` for inference, with its BatchNorm layers folded into
+    neighbouring layers or reduced to per-channel affines"""
+    unet = copy.deepcopy(unet).eval()
+    for m in list(unet.modules()):
+        if isinstance(m, NonPreactResBlock):
+            fold_bn_into_conv(m.conv_a, m.norm_a)
+            fold_bn_into_conv(m.conv_b, m.norm_b)
+            m.norm_a, m.norm_b = nn.Identity(), nn.Identity()
+        elif isinstance(m, PreactResBlock):
+            fold_bn_into_mixer(m.time_mixer, m.conv_b.norm)
+            m.conv_b.norm = nn.Identity()
+        elif isinstance(m, TimeEmbeddingMLP):
+            bn, lin, *_ = m.time_emb_mlp
+            fold_bn_into_linear(bn, lin)
+            m.time_emb_mlp[0] = nn.Identity()
+        elif isinstance(m, PreactConvBlock) and isinstance(m.norm, nn.BatchNorm2d):
+            m.norm = ChannelAffine.from_batchnorm(m.norm)
+    return unet.requires_grad_(False)
+
+# %% ../nbs/08_inference.ipynb 14
+def _quantized_regions(unet: Unet):
+    """(parent, name) of the submodules of `unet` that are quantized as a whole,
+    the largest that FX can trace. `Unet.forward` and the skip concatenation
+    in `Upblock.forward` branch on properties of their inputs"""
+    for i in range(len(unet.downblocks)):
+        yield unet.downblocks, str(i)
+    yield unet, "middle"
+    for ub in unet.upblocks:
+        yield ub, "upsampler"
+        for i in range(len(ub.convs)):
+            yield ub.convs, str(i)
+    yield unet, "end"
+
+
+def quantize_static(
+    unet: Unet, dl, n_batches: int = 8, backend: str | None = None
+) -> Unet:
+    """Copy of `unet` for inference with int8 convolutions, calibrated on
+    `n_batches` ((x_t, t), epsilon) batches of `dl`"""
+    backend = backend or torch.backends.quantized.engine
+    unet = fuse_for_inference(unet)
+    qconfig_mapping = tq.get_default_qconfig_mapping(backend)
+    # The mixers modulate every example differently, so they stay in floating
+    # point, and stay modules for `TimeEmbeddingCache` to find
+    config = PrepareCustomConfig().set_non_traceable_module_classes(
+        [TimeEmbeddingMixer]
+    )
+    regions = list(_quantized_regions(unet))
+    with typechecking(False):
+        for parent, name in regions:
+            region = prepare_fx(
+                getattr(parent, name),
+                qconfig_mapping,
+                example_inputs=(),
+                prepare_custom_config=config,
+            )
+            setattr(parent, name, region)
+    with torch.no_grad():
+        for (x_t, t), _ in itertools.islice(dl, n_batches):
+            unet(x_t, t)
+    for parent, name in regions:
+        setattr(parent, name, convert_fx(getattr(parent, name)))
+    return unet
+
+
+# %% ../nbs/08_inference.ipynb 16
+@torch.no_grad()
+def denoising_mse(unet: Unet, dl) -> float:
+    """Mean squared error of the noise predictions over ((x_t, t), epsilon) batches"""
+    se, n = 0.0, 0
+    for (x_t, t), epsilon in dl:
+        se += (unet(x_t, t) - epsilon).pow(2).sum().item()
+        n += epsilon.numel()
+    return se / n
+
+# %% ../nbs/08_inference.ipynb 25
+def export_onnx(unet: Unet, path, img_size=(32, 32), opset_version=17):
+    """Export `unet`, with BatchNorm folded, to ONNX with a dynamic batch size"""
+    unet = fuse_for_inference(unet)
+    x_t = torch.randn(2, unet.start.in_channels, *img_size)
+    t = torch.rand(2)
+    # torch>=2.5 can also export through dynamo, which doesn't support the
+    # data-independent checks in `Unet.forward`
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    with typechecking(False):
+        torch.onnx.export(
+            unet,
+            (x_t, t),
+            str(path),
+            input_names=["x_t", "t"],
+            output_names=["noise_pred"],
+            dynamic_axes={"x_t": {0: "bs"}, "t": {0: "bs"}, "noise_pred": {0: "bs"}},
+            opset_version=opset_version,
+            **kwargs,
+        )
+
+
+class OnnxUnet:
+    """ONNX Runtime session with the `Unet` calling convention"""
+
+    def __init__(self, path, providers=("CPUExecutionProvider",)):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(path), sess_options=opts, providers=list(providers)
+        )
+        _, self.color_channels, *self.img_size = self.session.get_inputs()[0].shape
+
+    def __call__(self, x_t, t):
+        (noise_pred,) = self.session.run(
+            None,
+            {
+                "x_t": x_t.detach().cpu().float().numpy(),
+                "t": t.detach().cpu().float().numpy(),
+            },
+        )
+        return torch.from_numpy(noise_pred).to(x_t.device)
@@ -0,0 +1,342 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/09_latent.ipynb.
+
+# %% auto 0
+__all__ = ['Autoencoder', 'AutoencoderLightning', 'ImageDataModule', 'load_autoencoder', 'LatentDataModule', 'LatentDDPMCallback']
+
+# %% ../nbs/09_latent.ipynb 2
+import hashlib
+import shutil
+from pathlib import Path
+from typing import Sequence
+
+import fsspec
+import lightning as L
+import numpy as np
+import torch
+from beartype import beartype
+from torch import nn
+from torch.utils.data import DataLoader
+
+from .data import DiffusionDataModule, MemmapDataset, _atomic_dir, noisify
+from .ddpm import DDPMCallback
+from .model import PreactConvBlock
+
+# %% ../nbs/09_latent.ipynb 5
+class Autoencoder(nn.Module):
+    """Convolutional autoencoder, halving the resolution at every level"""
+
+    @beartype
+    def __init__(
+        self,
+        nfs: Sequence[int],
+        color_channels: int,
+        latent_channels: int,
+        act: type[nn.Module] = nn.SiLU,
+        std_momentum: float = 0.01,
+    ):
+        super().__init__()
+        self.color_channels = color_channels
+        self.latent_channels = latent_channels
+        self.downsampling_factor = 2 ** (len(nfs) - 1)
+        self.std_momentum = std_momentum
+
+        encoder = [nn.Conv2d(color_channels, nfs[0], kernel_size=3, padding=1)]
+        for c_in, c_out in zip(nfs, nfs[1:]):
+            encoder.append(PreactConvBlock(c_in, c_out, act=act, stride=2))
+            encoder.append(PreactConvBlock(c_out, c_out, act=act))
+        encoder.append(PreactConvBlock(nfs[-1], latent_channels, act=act))
+        self.encoder = nn.Sequential(*encoder)
+
+        decoder = [nn.Conv2d(latent_channels, nfs[-1], kernel_size=3, padding=1)]
+        for c_in, c_out in zip(nfs[::-1], nfs[-2::-1]):
+            decoder.append(nn.Upsample(scale_factor=2))
+            decoder.append(PreactConvBlock(c_in, c_out, act=act))
+            decoder.append(PreactConvBlock(c_out, c_out, act=act))
+        decoder.append(PreactConvBlock(nfs[0], color_channels, act=act))
+        self.decoder = nn.Sequential(*decoder)
+
+        self.register_buffer("latent_std", torch.ones(()))
+
+    def forward(self, x):
+        """Reconstruct `x`, updating the running standard deviation of the
+        latents in training mode"""
+        z = self.encoder(x)
+        if self.training:
+            with torch.no_grad():
+                self.latent_std.lerp_(z.std(), self.std_momentum)
+        return self.decoder(z)
+
+    def encode(self, x):
+        return self.encoder(x) / self.latent_std
+
+    def decode(self, z):
+        return self.decoder(z * self.latent_std)
+
+# %% ../nbs/09_latent.ipynb 8
+class AutoencoderLightning(L.LightningModule):
+    @beartype
+    def __init__(
+        self,
+        color_channels: int,
+        nfs: Sequence[int] = (32, 64, 128),
+        latent_channels: int = 4,
+        lr: float = 1e-3,
+        adamw_epsilon: float = 1e-5,
+        act: type[torch.nn.Module] | str = "torch.nn.SiLU",
+    ):
+        """Autoencoder training code
+
+        Args:
+            color_channels: Color channels of the images
+            nfs: Number of channels at each resolution level. The latents
+                are 2**(len(nfs) - 1) times smaller than the images
+            latent_channels: Channels of the latents
+            lr: learning rate
+            adamw_epsilon: term added to the denominator to improve numerical
+                stability
+            act: activation function
+        """
+        super().__init__()
+        if isinstance(act, str):
+            act = eval(act)
+        self.autoencoder = Autoencoder(
+            nfs=nfs,
+            color_channels=color_channels,
+            latent_channels=latent_channels,
+            act=act,
+        )
+        self.save_hyperparameters()
+        self.loss_fn = torch.nn.MSELoss()
+
+    def step(self, x_0):
+        return self.loss_fn(self.autoencoder(x_0), x_0)
+
+    def training_step(self, batch, batch_idx):
+        loss = self.step(batch)
+        self.log("train_loss", loss, on_step=True, sync_dist=True)
+        self.log("latent_std", self.autoencoder.latent_std, on_step=True)
+        return loss
+
+    def validation_step(self, batch, batch_idx):
+        loss = self.step(batch)
+        self.log("test_loss", loss, sync_dist=True)
+        return loss
+
+    def configure_optimizers(self):
+        optimizer = torch.optim.AdamW(
+            self.parameters(),
+            lr=self.hparams.lr,
+            eps=self.hparams.adamw_epsilon,
+        )
+        return {
+            "optimizer": optimizer,
+            "lr_scheduler": {
+                "scheduler": torch.optim.lr_scheduler.OneCycleLR(
+                    optimizer,
+                    max_lr=self.hparams.lr,
+                    total_steps=self.trainer.estimated_stepping_batches,
+                ),
+                "interval": "step",
+                "frequency": 1,
+            },
+        }
+
+# %% ../nbs/09_latent.ipynb 9
+class ImageDataModule(L.LightningDataModule):
+    """The clean, normalized images of a `DiffusionDataModule`, without any
+    noise or freezing. Batches are sliced out of its cached uint8 images
+    rather than decoded every epoch"""
+
+    def __init__(self, images: DiffusionDataModule):
+        super().__init__()
+        self.images = images
+        self.bs = images.bs
+        self.img_size = images.img_size
+
+    def prepare_data(self):
+        self.images.prepare_data()
+
+    def setup(self, stage: str | None = None):
+        self.images.setup(stage)
+        splits = ("train", *self.images.test_splits)
+        self.ds = {
+            split: MemmapDataset(self.images.clean_path(split)) for split in splits
+        }
+
+    def _collate(self, batch):
+        (x_0,) = batch
+        return self.images.normalize(x_0)
+
+    def dataloader(self, split, shuffle=False):
+        return DataLoader(
+            self.ds[split],
+            shuffle=shuffle,
+            batch_size=self.bs,
+            collate_fn=self._collate,
+            num_workers=self.images.n_workers,
+        )
+
+    def train_dataloader(self):
+        return self.dataloader("train", shuffle=True)
+
+    def val_dataloader(self):
+        return self.dataloader("test")
+
+# %% ../nbs/09_latent.ipynb 10
+def load_autoencoder(ckpt):
+    """The trained, frozen autoencoder of an `AutoencoderLightning` checkpoint"""
+    # The hyperparameters include classes, so this can't be weights_only
+    with fsspec.open(ckpt, "rb") as f:
+        ckpt = torch.load(f, map_location="cpu", weights_only=False)
+    model = AutoencoderLightning(**ckpt["hyper_parameters"])
+    model.load_state_dict(ckpt["state_dict"])
+    return model.autoencoder.requires_grad_(False).eval()
+
+# %% ../nbs/09_latent.ipynb 13
+class LatentDataModule(L.LightningDataModule):
+    """Latents of a `DiffusionDataModule`'s images, encoded by the autoencoder
+    of an `AutoencoderLightning` checkpoint"""
+
+    def __init__(
+        self,
+        images: DiffusionDataModule,
+        autoencoder_ckpt: str,
+        data_dir: str | None = None,
+    ):
+        super().__init__()
+        self.images = images
+        self.autoencoder_ckpt = autoencoder_ckpt
+        self.data_dir = images.data_dir if data_dir is None else Path(data_dir)
+        self.bs = images.bs
+        # Loaded by `prepare_data` or `setup` rather than here, so that
+        # building the DataModule (e.g. from a config) doesn't read the
+        # checkpoint
+        self.autoencoder = None
+        self.autoencoder_key = None
+        self.img_size = None
+
+    def _load_autoencoder(self):
+        """Load the autoencoder, unless it is loaded already"""
+        if self.autoencoder is not None:
+            return
+        self.autoencoder = load_autoencoder(self.autoencoder_ckpt)
+        # Keyed on the weights (and `latent_std`) rather than the checkpoint's
+        # name, so that a retrained autoencoder doesn't reuse stale latents
+        h = hashlib.sha256()
+        for name, x in self.autoencoder.state_dict().items():
+            h.update(name.encode())
+            h.update(x.cpu().numpy().tobytes())
+        self.autoencoder_key = h.hexdigest()[:16]
+        f = self.autoencoder.downsampling_factor
+        self.img_size = tuple(s // f for s in self.images.img_size)
+
+    @property
+    def cached_dir(self):
+        return self.data_dir / (
+            f"{self.__class__.__name__}_{self.images.hf_ds_uri}"
+            f"_{self.images.cache_key}_{self.autoencoder_key}"
+        )
+
+    def clean(self):
+        shutil.rmtree(self.cached_dir)
+
+    @torch.no_grad()
+    def _encode(self, dl, path):
+        n = len(dl.dataset)
+        z_0 = np.lib.format.open_memmap(
+            path,
+            mode="w+",
+            dtype=np.float32,
+            shape=(n, self.autoencoder.latent_channels, *self.img_size),
+        )
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        autoencoder = self.autoencoder.to(device)
+        i = 0
+        for x_0 in dl:
+            z = autoencoder.encode(x_0.to(device)).cpu().numpy()
+            z_0[i : i + len(z)] = z
+            i += len(z)
+        z_0.flush()
+        self.autoencoder.cpu()
+        return z_0
+
+    def _freeze(self, z_0, path, seed=0):
+        arrays = {}
+        for name, dtype, shape in (
+            ("z_t", np.float32, z_0.shape),
+            ("t", np.float32, z_0.shape[:1]),
+            ("epsilon", np.float32, z_0.shape),
+        ):
+            arrays[name] = np.lib.format.open_memmap(
+                path / f"{name}.npy", mode="w+", dtype=dtype, shape=shape
+            )
+        for i in range(len(z_0)):
+            # Seeded per latent by its position, so that the noise doesn't
+            # depend on the batch size, which the cache isn't keyed on
+            generator = torch.Generator().manual_seed(seed + i)
+            z_0_ = torch.from_numpy(z_0[i : i + 1])
+            (z_t, t), epsilon = noisify(z_0_, generator=generator)
+            arrays["z_t"][i : i + 1] = z_t.numpy()
+            arrays["t"][i : i + 1] = t.numpy()
+            arrays["epsilon"][i : i + 1] = epsilon.numpy()
+        for a in arrays.values():
+            a.flush()
+
+    def prepare_data(self):
+        """Encode the images, unless they are cached already"""
+        self._load_autoencoder()
+        if self.cached_dir.exists():
+            return
+        images = ImageDataModule(self.images)
+        images.setup()
+        with _atomic_dir(self.cached_dir) as tmp_dir:
+            for split in images.ds:
+                split_dir = tmp_dir / split
+                split_dir.mkdir()
+                z_0 = self._encode(images.dataloader(split), split_dir / "z_0.npy")
+                if split != "train":
+                    self._freeze(z_0, split_dir)
+
+    def setup(self, stage: str | None = None):
+        # Lightning only prepares the data on one process per node
+        self.prepare_data()
+        train, test = self.cached_dir / "train", self.cached_dir / "test"
+        self.ds = {
+            "train": MemmapDataset(train / "z_0.npy"),
+            "test": MemmapDataset(
+                test / "z_t.npy", test / "t.npy", test / "epsilon.npy"
+            ),
+        }
+
+    def _collate(self, batch):
+        (z_0,) = batch
+        return noisify(z_0)
+
+    def _frozen_collate(self, batch):
+        z_t, t, epsilon = batch
+        return (z_t, t), epsilon
+
+    def train_dataloader(self):
+        return DataLoader(
+            self.ds["train"],
+            shuffle=True,
+            batch_size=self.bs,
+            collate_fn=self._collate,
+            num_workers=self.images.n_workers,
+        )
+
+    def val_dataloader(self):
+        return DataLoader(
+            self.ds["test"],
+            batch_size=self.bs,
+            collate_fn=self._frozen_collate,
+            num_workers=self.images.n_workers,
+        )
+
+# %% ../nbs/09_latent.ipynb 19
+class LatentDDPMCallback(DDPMCallback):
+    def sample(self, trainer, pl_module):
+        z_0 = super().sample(trainer, pl_module)
+        autoencoder = trainer.datamodule.autoencoder.to(pl_module.device)
+        with torch.no_grad():
+            return autoencoder.decode(z_0)
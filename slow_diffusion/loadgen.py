@@ -0,0 +1,79 @@
+"""Written by hand. Local load generator for the Cog predictor, reports
+throughput and latency percentiles without going through a server
+
+PYTHONPATH=. python slow_diffusion/loadgen.py --concurrency 16 --n-requests 64
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from slow_diffusion.predict import Predictor
+from slow_diffusion.training import get_tiny_unet_lightning
+
+
+async def run(predictor, n_requests, concurrency, n_imgs, n_steps, sampler):
+    # At most `concurrency` predictions in flight, like Cog's `concurrency.max`
+    slots = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with slots:
+            start = time.perf_counter()
+            await predictor.predict(n_imgs=n_imgs, n_steps=n_steps, sampler=sampler)
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(request() for _ in range(n_requests)))
+    latencies = np.array(latencies)
+    elapsed = time.perf_counter() - start
+    return {
+        "imgs/sec": n_requests * n_imgs / elapsed,
+        "p50 latency (s)": np.percentile(latencies, 50),
+        "p99 latency (s)": np.percentile(latencies, 99),
+        "mean batch size": np.mean(predictor.batcher.batch_sizes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--ckpt",
+        help="UnetLightning checkpoint or ONNX export, defaults to an untrained tiny U-Net",
+    )
+    parser.add_argument("--n-requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--n-imgs", type=int, default=1, help="images per request")
+    parser.add_argument("--n-steps", type=int, default=10)
+    parser.add_argument("--sampler", default="ddim")
+    parser.add_argument("--max-batch-size", type=int, default=Predictor.max_batch_size)
+    parser.add_argument("--max-wait-ms", type=float, default=Predictor.max_wait * 1000)
+    args = parser.parse_args()
+
+    predictor = Predictor()
+    predictor.max_batch_size = args.max_batch_size
+    predictor.max_wait = args.max_wait_ms / 1000
+    if args.ckpt:
+        predictor.setup(args.ckpt)
+    else:
+        predictor.serve(get_tiny_unet_lightning().unet)
+
+    stats = asyncio.run(
+        run(
+            predictor,
+            args.n_requests,
+            args.concurrency,
+            args.n_imgs,
+            args.n_steps,
+            args.sampler,
+        )
+    )
+    predictor.batcher.close()
+    for k, v in stats.items():
+        print(f"{k:>16}: {v:.3f}")
+
+
+if __name__ == "__main__":
+    main()
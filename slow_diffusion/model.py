@@ -1,18 +1,28 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/00_model.ipynb.
 
 # %% auto 0
-__all__ = ['InFeatureMapTensor', 'OutFeatureMapTensor', 'TimeStepTensor', 'TimeStepEmbeddingTensor', 'PreactConvBlock',
-           'timestep_embedding', 'TimeEmbeddingMixer', 'PreactResBlock', 'NonPreactResBlock', 'Downblock', 'Upblock',
-           'TimeEmbeddingMLP', 'Unet']
+__all__ = ['InFeatureMapTensor', 'OutFeatureMapTensor', 'TimeStepTensor', 'TimeStepEmbeddingTensor', 'set_typechecking',
+           'typechecking', 'typechecked', 'PreactConvBlock', 'timestep_embedding', 'TimeEmbeddingMixer',
+           'PreactResBlock', 'NonPreactResBlock', 'Downblock', 'Upblock', 'TimeEmbeddingMLP', 'Unet',
+           'TimeEmbeddingCache', 'compile_unet']
 
 # %% ../nbs/00_model.ipynb 3
+import functools
+import itertools
 import math
-from typing import Sequence, TypeAlias
+import os
+import warnings
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Sequence, TypeAlias
 
 import torch
 from beartype import beartype
 from jaxtyping import Float, jaxtyped
 from torch import Tensor, nn
+from torch.utils.checkpoint import checkpoint
+
+from .data import get_t_checking
 
 # %% ../nbs/00_model.ipynb 4
 InFeatureMapTensor: TypeAlias = Float[Tensor, "bs c_in h_in w_in"]
@@ -21,6 +31,39 @@ TimeStepTensor: TypeAlias = Float[Tensor, "bs"]  # from 0 to 1
 TimeStepEmbeddingTensor: TypeAlias = Float[Tensor, "bs t"]
 
 # %% ../nbs/00_model.ipynb 6
+_typecheck = os.environ.get("SLOW_DIFFUSION_TYPECHECK", "1") not in ("0", "false")
+
+
+def set_typechecking(enabled: bool) -> bool:
+    """Turn runtime type checking of forward passes on or off, returning the previous setting"""
+    global _typecheck
+    previous, _typecheck = _typecheck, enabled
+    return previous
+
+
+@contextmanager
+def typechecking(enabled: bool):
+    """Turn runtime type checking on or off within this context"""
+    previous = set_typechecking(enabled)
+    try:
+        yield
+    finally:
+        set_typechecking(previous)
+
+
+def typechecked(fn):
+    """`jaxtyped(typechecker=beartype)`, bypassed when type checking is turned off"""
+    checked = jaxtyped(typechecker=beartype)(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _typecheck:
+            return checked(*args, **kwargs)
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+# %% ../nbs/00_model.ipynb 9
 class PreactConvBlock(nn.Module):
     """Wrapper for a Conv block with normalization and activation"""
 
@@ -46,15 +89,15 @@ class PreactConvBlock(nn.Module):
             bias=False,
         )
 
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(self, x: InFeatureMapTensor) -> OutFeatureMapTensor:
         x = self.norm(x)
         x = self.act(x)
         x = self.conv(x)
         return x
 
-# %% ../nbs/00_model.ipynb 7
-@jaxtyped(typechecker=beartype)
+# %% ../nbs/00_model.ipynb 10
+@typechecked
 def timestep_embedding(
     ts: TimeStepTensor, emb_dim: int, max_period: int = 10_000
 ) -> TimeStepEmbeddingTensor:
@@ -65,7 +108,16 @@ def timestep_embedding(
     embedding = torch.cat([embedding.sin(), embedding.cos()], dim=-1)
     return embedding
 
-# %% ../nbs/00_model.ipynb 8
+# %% ../nbs/00_model.ipynb 11
+# Sampling-time lookup tables for the time embeddings, see TimeEmbeddingCache
+_time_embedding_cache: ContextVar["TimeEmbeddingCache | None"] = ContextVar(
+    "time_embedding_cache", default=None
+)
+_cached_modulations: ContextVar[dict | None] = ContextVar(
+    "cached_modulations", default=None
+)
+
+
 class TimeEmbeddingMixer(nn.Module):
     """Incorporate the time embedding into the ResBlock logits"""
 
@@ -75,15 +127,24 @@ class TimeEmbeddingMixer(nn.Module):
         self.lin = nn.Linear(c_time, c_out * 2)
         self.act = act()
 
-    @jaxtyped(typechecker=beartype)
+    def modulation(self, t_emb):
+        return self.lin(self.act(t_emb))
+
+    @typechecked
     def forward(
         self, x: InFeatureMapTensor, t_emb: TimeStepEmbeddingTensor
     ) -> OutFeatureMapTensor:
-        t_emb = self.lin(self.act(t_emb))[:, :, None, None]
-        scale, shift = torch.chunk(t_emb, 2, dim=1)
+        # Context variables can't be traced, so compiled forwards compute the
+        # modulation themselves
+        cached = None if torch.compiler.is_compiling() else _cached_modulations.get()
+        if cached is not None:
+            t_emb = cached[self]
+        else:
+            t_emb = self.modulation(t_emb)
+        scale, shift = torch.chunk(t_emb[:, :, None, None], 2, dim=1)
         return x * (1 + scale) + shift
 
-# %% ../nbs/00_model.ipynb 9
+# %% ../nbs/00_model.ipynb 12
 class PreactResBlock(nn.Module):
     """Conv resblock with the preactivation configuration and time embedding modulation"""
 
@@ -108,9 +169,6 @@ class PreactResBlock(nn.Module):
         else:
             self.id_conv = None
 
-        # Used for the Unet cross-link
-        self.output = None
-
     def non_residual(self, x, t_emb):
         x = self.conv_a(x)
         x = self.time_mixer(x, t_emb)
@@ -123,15 +181,14 @@ class PreactResBlock(nn.Module):
         else:
             return x
 
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(
         self, x: InFeatureMapTensor, t_emb: TimeStepEmbeddingTensor
     ) -> OutFeatureMapTensor:
         x = self.non_residual(x, t_emb) + self.residual(x)
-        self.output = x
         return x
 
-# %% ../nbs/00_model.ipynb 10
+# %% ../nbs/00_model.ipynb 13
 class NonPreactResBlock(nn.Module):
     """Conv resblock with the classic residual configuration and time embedding modulation"""
 
@@ -161,10 +218,7 @@ class NonPreactResBlock(nn.Module):
         else:
             self.id_conv = None
 
-        # Used for the Unet cross-link
-        self.output = None
-
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(
         self, x_orig: InFeatureMapTensor, t_emb: TimeStepEmbeddingTensor
     ) -> OutFeatureMapTensor:
@@ -178,10 +232,9 @@ class NonPreactResBlock(nn.Module):
             x_orig = self.id_conv(x_orig)
         x += x_orig
         x = self.act_b(x)
-        self.output = x
         return x
 
-# %% ../nbs/00_model.ipynb 14
+# %% ../nbs/00_model.ipynb 17
 class Downblock(nn.Module):
     """A superblock consisting of many downblocks of similar resolutions"""
 
@@ -211,17 +264,30 @@ class Downblock(nn.Module):
             self.convs.append(res_block_cls(c_time, c_out, c_out, act=act))
         self.downsampler = nn.Conv2d(c_out, c_out, kernel_size=3, stride=2, padding=1)
 
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(
         self, x: InFeatureMapTensor, t: TimeStepEmbeddingTensor
-    ) -> OutFeatureMapTensor:
+    ) -> tuple[OutFeatureMapTensor, list[Float[Tensor, "bs c_out h_in w_in"]]]:
+        """Returns the output and the activations of each layer, which are
+        the skip connections for the counterpart upblock"""
+        skips = []
         for conv in self.convs:
             x = conv(x, t)
+            skips.append(x)
         if self.downsample:
             x = self.downsampler(x)
-        return x
+        return x, skips
+
+# %% ../nbs/00_model.ipynb 19
+def _cat_channels(x, skip):
+    """Concatenate along the channel dimension, keeping `x`'s memory format.
+    `torch.cat` falls back to contiguous unless all of its inputs agree"""
+    out = torch.cat((x, skip), dim=1)
+    if x.is_contiguous(memory_format=torch.channels_last):
+        out = out.contiguous(memory_format=torch.channels_last)
+    return out
+
 
-# %% ../nbs/00_model.ipynb 16
 class Upblock(nn.Module):
     """A superblock consisting of many upblocks of similar resolutions
     and logic to use the activations of the counterpart downblock."""
@@ -265,17 +331,17 @@ class Upblock(nn.Module):
             res_block_cls=downblock.res_block_cls,
         )
 
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(
-        self, x: InFeatureMapTensor, downblock: Downblock, t: TimeStepEmbeddingTensor
+        self, x: InFeatureMapTensor, skips: list[Tensor], t: TimeStepEmbeddingTensor
     ) -> OutFeatureMapTensor:
         if self.upsample:
             x = self.upsampler(x)
-        for up, down in zip(self.convs, reversed(downblock.convs)):
-            x = up(torch.cat((x, down.output), dim=1), t)
+        for up, skip in zip(self.convs, reversed(skips)):
+            x = up(_cat_channels(x, skip), t)
         return x
 
-# %% ../nbs/00_model.ipynb 18
+# %% ../nbs/00_model.ipynb 21
 class TimeEmbeddingMLP(nn.Module):
     """Small neural network to modify the "raw" time embeddings"""
 
@@ -290,7 +356,7 @@ class TimeEmbeddingMLP(nn.Module):
             nn.Linear(c_out, c_out),
         )
 
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(self, t: TimeStepTensor) -> TimeStepEmbeddingTensor:
         # Look up the sin/cos embedding  of the time step
         x = timestep_embedding(t, self.c_in).to(t.device)
@@ -298,7 +364,26 @@ class TimeEmbeddingMLP(nn.Module):
         x = self.time_emb_mlp(x)
         return x
 
-# %% ../nbs/00_model.ipynb 19
+# %% ../nbs/00_model.ipynb 22
+@contextmanager
+def _preserved_batchnorm_stats(module):
+    """Roll back updates to BatchNorm running statistics within this context,
+    so that recomputing a checkpointed forward does not count the batch twice"""
+    bns = [
+        m
+        for m in module.modules()
+        if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.track_running_stats
+    ]
+    saved = [[b.clone() for b in bn.buffers(recurse=False)] for bn in bns]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for bn, buffers in zip(bns, saved):
+                for b, b_saved in zip(bn.buffers(recurse=False), buffers):
+                    b.copy_(b_saved)
+
+
 class Unet(nn.Module):
     """Diffusion U-net with a diffusion time dimension"""
 
@@ -309,10 +394,18 @@ class Unet(nn.Module):
         act: type[nn.Module],
         color_channels: int = 3,
         res_block_cls: type[nn.Module] = PreactResBlock,
+        checkpoint_levels: Sequence[int] = (),
+        memory_format: torch.memory_format = torch.contiguous_format,
     ):
         assert len(n_blocks) - 1 == len(nfs)
         super().__init__()
 
+        # Resolution levels, from 0 (the outermost down/upblocks) to len(nfs) - 1
+        # (the middle block), whose activations are recomputed during backprop
+        if not set(checkpoint_levels) <= set(range(len(nfs))):
+            raise ValueError(f"checkpoint_levels must be between 0 and {len(nfs) - 1}")
+        self.checkpoint_levels = set(checkpoint_levels)
+
         self.time_embedding = TimeEmbeddingMLP(nfs[0], 4 * nfs[0])
         c_time = self.time_embedding.c_out
 
@@ -339,17 +432,157 @@ class Unet(nn.Module):
         # vvv double check this
         self.end = PreactConvBlock(nfs[0], color_channels, act=act)
 
+        # Weights and activations share a layout, so that convolutions do not
+        # reorder their inputs. Inputs are converted on the way in
+        self.memory_format = memory_format
+        self.to(memory_format=memory_format)
+
+    def _checkpointed(self, level, block, *args):
+        """Run `block`, recomputing its activations in the backward pass if
+        `level` is checkpointed"""
+        if level not in self.checkpoint_levels or not (
+            self.training and torch.is_grad_enabled()
+        ):
+            return block(*args)
+        return checkpoint(
+            block,
+            *args,
+            use_reentrant=False,
+            context_fn=lambda: (nullcontext(), _preserved_batchnorm_stats(block)),
+        )
+
+    @contextmanager
+    def cached_time_embeddings(self, ts):
+        """Look up time embeddings from a `TimeEmbeddingCache` of the time steps
+        `ts` for forward passes within this context. The table is not updated
+        within it, so the weights must not change (e.g., by an optimizer step or
+        an EMA update). Raises on exit, even by an exception, if they did or if
+        a forward pass was given time steps off the grid"""
+        cache = TimeEmbeddingCache(self, ts)
+        token = _time_embedding_cache.set(cache)
+        try:
+            yield cache
+        finally:
+            _time_embedding_cache.reset(token)
+            cache.check()
+
     # Uniquely for a U-net module output dimensions must match the input dimensions
-    @jaxtyped(typechecker=beartype)
+    @typechecked
     def forward(self, x_t: InFeatureMapTensor, t: TimeStepTensor) -> InFeatureMapTensor:
-        te = self.time_embedding(t)
+        # Context variables can't be traced, so compiled forwards skip the cache
+        compiling = torch.compiler.is_compiling()
+        cache = None if compiling else _time_embedding_cache.get()
+        if cache is not None and cache.unet is self and not self.training:
+            te, modulations = cache.lookup(t)
+        else:
+            te, modulations = self.time_embedding(t), None
         _, c, _, _ = x_t.shape
         if c != self.start.in_channels:
             raise ValueError("model color channels must match input data channels")
-        x = self.start(x_t)
-        for db in self.downblocks:
-            x = db(x, te)
-        x = self.middle(x, te)
-        for ub, db in zip(self.upblocks, reversed(self.downblocks)):
-            x = ub(x, db, te)
-        return self.end(x)
+        token = None if compiling else _cached_modulations.set(modulations)
+        try:
+            x = self.start(x_t.contiguous(memory_format=self.memory_format))
+            skips = []
+            for level, db in enumerate(self.downblocks):
+                x, skips_ = self._checkpointed(level, db, x, te)
+                skips.append(skips_)
+            x = self._checkpointed(len(self.downblocks), self.middle, x, te)
+            for level, ub in zip(reversed(range(len(self.upblocks))), self.upblocks):
+                x = self._checkpointed(level, ub, x, skips.pop(), te)
+            return self.end(x)
+        finally:
+            if token is not None:
+                _cached_modulations.reset(token)
+
+# %% ../nbs/00_model.ipynb 40
+class TimeEmbeddingCache:
+    """Time embeddings and `TimeEmbeddingMixer` projections, tabulated on a
+    grid of time steps"""
+
+    def __init__(self, unet: Unet, ts):
+        self.unet = unet
+        self.mixers = [m for m in unet.modules() if isinstance(m, TimeEmbeddingMixer)]
+        device = next(unet.parameters()).device
+        self.ts = torch.empty(0, device=device)
+        # Whether a lookup fell off the grid, kept on the device so that
+        # forward passes don't sync with the host
+        self.missed = torch.zeros((), dtype=torch.bool, device=device)
+        self.add(ts)
+        if len(self.ts) == 0:
+            raise ValueError("the time embedding cache needs at least one time step")
+
+    def weights(self):
+        """The parameters and buffers that the table is computed from"""
+        return list(
+            itertools.chain(
+                self.unet.time_embedding.parameters(),
+                self.unet.time_embedding.buffers(),
+                *(m.parameters() for m in self.mixers),
+            )
+        )
+
+    @torch.no_grad()
+    def add(self, ts=()):
+        """Tabulate time steps `ts`, in addition to the existing ones"""
+        ts = torch.as_tensor(ts, dtype=torch.float, device=self.ts.device)
+        self.ts = torch.cat([self.ts, ts]).unique()  # sorted
+        self.te = self.unet.time_embedding(self.ts)
+        self.modulations = [m.modulation(self.te) for m in self.mixers]
+        self.weights_seen = [w.detach().clone() for w in self.weights()]
+
+    @torch.no_grad()
+    def check(self):
+        """Raise if a lookup was off the grid, or if the weights changed since
+        the table was computed. Syncs the accelerator with the host once"""
+        weights = self.weights()
+        if [w.shape for w in weights] != [w.shape for w in self.weights_seen]:
+            raise RuntimeError("time embedding weights changed while they were cached")
+        changed = [(w != w_).any() for w, w_ in zip(weights, self.weights_seen)]
+        missed, *changed = torch.stack([self.missed, *changed]).tolist()
+        if any(changed):
+            raise RuntimeError("time embedding weights changed while they were cached")
+        if missed:
+            raise ValueError("time steps off the grid, see `TimeEmbeddingCache.add`")
+
+    def lookup(self, t: Tensor):
+        """Time embeddings and a mapping of mixer to projection for a batch of
+        time steps. Time steps off the grid get the embeddings of a neighbour,
+        which `check` raises about. With `t_checking` they raise right away"""
+        idx = torch.searchsorted(self.ts, t).clamp(max=len(self.ts) - 1)
+        missed = (self.ts[idx] != t).any()
+        if get_t_checking() and missed:
+            raise ValueError("time steps off the grid, see `TimeEmbeddingCache.add`")
+        self.missed |= missed
+        modulations = {m: mod[idx] for m, mod in zip(self.mixers, self.modulations)}
+        return self.te[idx], modulations
+
+# %% ../nbs/00_model.ipynb 47
+def compile_unet(
+    unet: Unet,
+    x_t: Tensor,
+    t: Tensor,
+    mode: str | None = None,
+    dynamic: bool | None = None,
+    modules: Sequence[str] = (),
+    backend: str | Callable = "inductor",
+) -> bool:
+    """Compile `unet`, or its submodules named in `modules`, in place and warm
+    it up on `(x_t, t)`. Returns whether compilation succeeded"""
+    targets = [unet.get_submodule(name) for name in modules] or [unet]
+    for m in targets:
+        # Shadows the eager forward of the class, which is restored by deleting
+        # the compiled one
+        m.forward = torch.compile(m.forward, mode=mode, dynamic=dynamic, backend=backend)
+    try:
+        with _preserved_batchnorm_stats(unet), torch.set_grad_enabled(unet.training):
+            out = unet(x_t, t)
+            if unet.training:
+                out.float().pow(2).mean().backward()
+    except Exception as e:
+        warnings.warn(f"Compilation failed, falling back to eager mode: {e}")
+        for m in targets:
+            del m.forward
+        return False
+    finally:
+        unet.zero_grad(set_to_none=True)
+    return True
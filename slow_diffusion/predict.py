@@ -1,10 +1,226 @@
-"""Placeholder for prediction, required to use Cog"""
-from cog import BasePredictor
-from typing import Any
+"""Written by hand. Cog predictor that keeps a U-Net warm and coalesces
+concurrent requests into batched sampler runs. Cog only runs predictions
+concurrently up to `concurrency.max` in cog.yaml"""
+import asyncio
+import inspect
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+import fsspec
+import torch
+from cog import BasePredictor, Input, Path
+from PIL import Image
+
+from slow_diffusion.ddpm import (
+    SAMPLERS,
+    compile_for_sampling,
+    get_sampler,
+    set_progress_bars,
+)
+from slow_diffusion.inference import OnnxUnet, fuse_for_inference
+from slow_diffusion.model import set_typechecking
+from slow_diffusion.training import UnetLightning
+
+MAX_BATCH_SIZE = int(os.environ.get("SLOW_DIFFUSION_MAX_BATCH_SIZE", 64))
+MAX_WAIT_MS = float(os.environ.get("SLOW_DIFFUSION_MAX_WAIT_MS", 50))
+# Size of the images to sample, for checkpoints from before UnetLightning
+# recorded it. ONNX exports have it in their input shape
+IMG_SIZE = tuple(
+    int(s) for s in os.environ.get("SLOW_DIFFUSION_IMG_SIZE", "32,32").split(",")
+)
+# Sample with a `torch.compile`d U-Net, see `compile_for_sampling`
+COMPILE = os.environ.get("SLOW_DIFFUSION_COMPILE", "0") not in ("0", "false")
+
+
+@dataclass
+class _Request:
+    n_imgs: int
+    key: tuple
+    future: Future = field(default_factory=Future)
+    submitted: float = field(default_factory=time.perf_counter)
+
+
+class DynamicBatcher:
+    """Run `run_batch(n_imgs, *key)` on a worker thread, coalescing requests
+    that share a key. A batch is dispatched once it holds `max_batch_size`
+    images or `max_wait` seconds after its first request arrived"""
+
+    def __init__(
+        self,
+        run_batch: Callable,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait=MAX_WAIT_MS / 1000,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batch_sizes = []
+        self._queue = queue.Queue()
+        self._deferred = deque()
+        self._worker = threading.Thread(target=self._loop, daemon=True)
+        self._worker.start()
+
+    def submit(self, n_imgs: int, *key) -> Future:
+        if not 1 <= n_imgs <= self.max_batch_size:
+            raise ValueError(
+                f"n_imgs must be between 1 and {self.max_batch_size}, got {n_imgs}"
+            )
+        req = _Request(n_imgs, key)
+        self._queue.put(req)
+        return req.future
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _next(self, timeout=None):
+        if self._deferred:
+            return self._deferred.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next()
+        if first is None:
+            return None
+        batch, n, skipped = [first], first.n_imgs, []
+        deadline = first.submitted + self.max_wait
+        while n < self.max_batch_size:
+            # past the deadline, still take whatever is already waiting
+            remaining = max(deadline - time.perf_counter(), 0)
+            try:
+                req = self._next(timeout=remaining)
+            except queue.Empty:
+                break
+            if (
+                req is not None
+                and req.key == first.key
+                and n + req.n_imgs <= self.max_batch_size
+            ):
+                batch.append(req)
+                n += req.n_imgs
+            else:
+                # different sampler settings (or shutdown), serve it next
+                skipped.append(req)
+                if req is None:
+                    break
+        self._deferred.extendleft(reversed(skipped))
+        return batch
+
+    def _loop(self):
+        while (batch := self._collect()) is not None:
+            sizes = [req.n_imgs for req in batch]
+            self.batch_sizes.append(sum(sizes))
+            try:
+                x = self.run_batch(sum(sizes), *batch[0].key)
+            except Exception as e:
+                for req in batch:
+                    req.future.set_exception(e)
+                continue
+            for req, x_ in zip(batch, x.split(sizes)):
+                req.future.set_result(x_)
+
+
+def load_unet(ckpt, map_location=None):
+    """The U-Net of a `UnetLightning` checkpoint, or of one of its subclasses
+    such as `DistillationLightning`, and the image size it was trained on"""
+    # The hyperparameters include classes, so this can't be weights_only
+    with fsspec.open(ckpt, "rb") as f:
+        ckpt = torch.load(f, map_location=map_location, weights_only=False)
+    # Subclasses add hyperparameters and modules (e.g. a distillation
+    # teacher) that serving doesn't need
+    params = inspect.signature(UnetLightning.__init__).parameters
+    hparams = {k: v for k, v in ckpt["hyper_parameters"].items() if k in params}
+    unet = UnetLightning(**hparams).unet
+    unet.load_state_dict(
+        {
+            k.removeprefix("unet."): v
+            for k, v in ckpt["state_dict"].items()
+            if k.startswith("unet.")
+        }
+    )
+    return unet.to(map_location).eval(), ckpt.get("img_size")
+
+
+def to_pil(x):
+    """Convert a (c, h, w) sample in [-0.5, 0.5] to an image"""
+    x = ((x + 0.5).clamp(0, 1) * 255).round().to(torch.uint8).cpu()
+    c, *_ = x.shape
+    if c == 1:
+        return Image.fromarray(x[0].numpy(), mode="L")
+    return Image.fromarray(x.permute(1, 2, 0).numpy())
+
 
 class Predictor(BasePredictor):
-    def setup(self):
-        ...
+    img_size = IMG_SIZE
+    max_batch_size = MAX_BATCH_SIZE
+    max_wait = MAX_WAIT_MS / 1000
+    compile = COMPILE
+
+    def setup(self, weights=None):
+        """Load a UnetLightning (or DistillationLightning) checkpoint, or an
+        ONNX export of its U-Net"""
+        ckpt = str(weights or os.environ.get("SLOW_DIFFUSION_CKPT", "model.ckpt"))
+        if ckpt.endswith(".onnx"):
+            self.serve(OnnxUnet(ckpt))
+            return
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.serve(*load_unet(ckpt, map_location=device))
+
+    def serve(self, unet, img_size=None):
+        """Keep `unet` resident and start batching requests for it, sampling
+        images of `img_size` (`IMG_SIZE` by default)"""
+        set_typechecking(False)
+        # The sampler runs on the batcher's thread, where progress bars would
+        # interleave with Cog's logs
+        set_progress_bars(False)
+        if isinstance(unet, OnnxUnet):
+            self.unet = unet
+            self.device = torch.device("cpu")
+            self.color_channels = unet.color_channels
+            # An export only takes the image size it was exported for
+            self.img_size = tuple(unet.img_size)
+        else:
+            self.unet = fuse_for_inference(unet)
+            self.device = next(unet.parameters()).device
+            self.color_channels = unet.start.in_channels
+            if img_size is not None:
+                self.img_size = tuple(img_size)
+            if self.compile:
+                sz = (1, self.color_channels, *self.img_size)
+                self.unet = compile_for_sampling(self.unet, sz, self.device)
+        self.batcher = DynamicBatcher(self.sample, self.max_batch_size, self.max_wait)
+        # warm up allocator and kernels before the first request
+        self.sample(1, "ddim", 2)
+
+    @torch.no_grad()
+    def sample(self, n_imgs, sampler, n_steps):
+        sz = (n_imgs, self.color_channels, *self.img_size)
+        return get_sampler(sampler)(self.unet, sz, n_steps, device=self.device)
 
-    def predict(self) -> Any:
-        ...
\ No newline at end of file
+    async def predict(
+        self,
+        n_imgs: int = Input(
+            description="Number of images", default=4, ge=1, le=MAX_BATCH_SIZE
+        ),
+        n_steps: int = Input(
+            description="Number of sampling steps", default=50, ge=2, le=1000
+        ),
+        sampler: str = Input(
+            description="Sampler", default="ddim", choices=list(SAMPLERS)
+        ),
+    ) -> List[Path]:
+        x_0 = await asyncio.wrap_future(self.batcher.submit(n_imgs, sampler, n_steps))
+        out_dir = Path(tempfile.mkdtemp())
+        paths = []
+        for i, x in enumerate(x_0):
+            path = out_dir / f"{i}.png"
+            to_pil(x).save(path)
+            paths.append(path)
+        return paths
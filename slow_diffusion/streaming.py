@@ -0,0 +1,336 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/10_streaming.ipynb.
+
+# %% auto 0
+__all__ = ['IMAGE_EXTENSIONS', 'write_shards', 'read_shard', 'n_images', 'shuffled', 'ShardStream', 'StreamingDataModule']
+
+# %% ../nbs/10_streaming.ipynb 2
+import collections
+import functools
+import io
+import itertools
+import random
+import tarfile
+from glob import glob
+from pathlib import Path
+
+import datasets
+import lightning as L
+import numpy as np
+import pyarrow.parquet as pq
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from .data import DiffusionDataModule, SeededBatch
+
+# %% ../nbs/10_streaming.ipynb 5
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
+
+
+def write_shards(images: DiffusionDataModule, split, out_dir, n_shards, fmt="parquet"):
+    """Write the undecoded images of a split of `images` to `n_shards` Parquet
+    or tar files"""
+    ds = images.load()[split].cast_column("image", datasets.Image(decode=False))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n_shards):
+        shard = ds.shard(n_shards, i, contiguous=True).select_columns(["image"])
+        path = out_dir / f"{split}-{i:05d}.{fmt}"
+        if fmt == "parquet":
+            shard.to_parquet(path)
+        elif fmt == "tar":
+            with tarfile.open(path, "w") as tar:
+                for j, img in enumerate(shard["image"]):
+                    ext = Image.open(io.BytesIO(img["bytes"])).format.lower()
+                    info = tarfile.TarInfo(f"{j:08d}.{ext}")
+                    info.size = len(img["bytes"])
+                    tar.addfile(info, io.BytesIO(img["bytes"]))
+        else:
+            raise ValueError(f"unknown shard format: {fmt}")
+        paths.append(path)
+    return paths
+
+
+def _is_image(member):
+    return member.isfile() and member.name.rpartition(".")[2] in IMAGE_EXTENSIONS
+
+
+def read_shard(path):
+    """The encoded images of a shard, in order"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=256):
+            yield from batch.column("image").field("bytes").to_pylist()
+    elif path.suffix == ".tar":
+        with tarfile.open(path) as tar:
+            for member in tar:
+                if _is_image(member):
+                    yield tar.extractfile(member).read()
+    else:
+        raise ValueError(f"unknown shard format: {path}")
+
+
+@functools.cache
+def n_images(path):
+    """The number of images in a shard, without decoding them"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    with tarfile.open(path) as tar:
+        return sum(map(_is_image, tar))
+
+# %% ../nbs/10_streaming.ipynb 8
+def shuffled(xs, buffer_size, rng):
+    """Shuffle `xs` approximately, holding at most `buffer_size` of them"""
+    if not buffer_size:
+        yield from xs
+        return
+    buffer = []
+    for x in xs:
+        if len(buffer) < buffer_size:
+            buffer.append(x)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = x
+    rng.shuffle(buffer)
+    yield from buffer
+
+# %% ../nbs/10_streaming.ipynb 11
+def _splitmix64(x):
+    x = x.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _batches(xs, bs):
+    while batch := list(itertools.islice(xs, bs)):
+        yield batch
+
+
+class ShardStream(IterableDataset):
+    """Batches of uint8 images streamed from `shards`, as (worker, x_0, keys).
+    The shards are spread over the DDP ranks and their dataloader workers.
+    With `drop_last`, every slot yields `n_batches` full batches"""
+
+    def __init__(
+        self,
+        shards,
+        bs,
+        to_tensor,
+        buffer_size=0,
+        seed=0,
+        rank=0,
+        world_size=1,
+        drop_last=True,
+    ):
+        self.shards = [Path(p) for p in shards]
+        self.bs = bs
+        self.to_tensor = to_tensor
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.drop_last = drop_last
+        self.epoch = 0
+        # Batches of this epoch already consumed from every worker, which are
+        # skipped when resuming from a checkpoint
+        self.skip = {}
+
+    def slots(self, n_workers):
+        """The indices of the shards of every (rank, worker) slot this epoch"""
+        idxs = list(range(len(self.shards)))
+        if self.buffer_size:
+            random.Random(f"{self.seed}-{self.epoch}").shuffle(idxs)
+        n_slots = self.world_size * n_workers
+        if len(idxs) < n_slots:
+            raise ValueError(
+                f"{len(idxs)} shards can't be spread over {self.world_size} "
+                f"rank(s) with {n_workers} worker(s) each"
+            )
+        return [idxs[i::n_slots] for i in range(n_slots)]
+
+    def n_batches(self, n_workers):
+        return (
+            min(
+                sum(n_images(self.shards[i]) for i in slot)
+                for slot in self.slots(n_workers)
+            )
+            // self.bs
+        )
+
+    def _images(self, idxs):
+        for i in idxs:
+            for row, img in enumerate(read_shard(self.shards[i])):
+                yield i << 32 | row, img
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker, n_workers = (0, 1) if info is None else (info.id, info.num_workers)
+        idxs = self.slots(n_workers)[self.rank * n_workers + worker]
+        rng = random.Random(f"{self.seed}-{self.epoch}-{self.rank}-{worker}")
+        images = shuffled(self._images(idxs), self.buffer_size, rng)
+        batches = _batches(images, self.bs)
+        if self.drop_last:
+            batches = itertools.islice(batches, self.n_batches(n_workers))
+        for i, batch in enumerate(batches):
+            # Skipped without decoding, but still drawn from the buffer so
+            # that the rest of the epoch is the same
+            if i < self.skip.get(worker, 0):
+                continue
+            keys, imgs = zip(*batch)
+            x_0 = torch.stack([self.to_tensor(Image.open(io.BytesIO(b))) for b in imgs])
+            yield worker, x_0, torch.tensor(keys)
+
+# %% ../nbs/10_streaming.ipynb 14
+class _Resumable:
+    """Iterate over the batches of a `ShardStream` dataloader from where `dm`
+    left off, noting the worker of every batch handed out"""
+
+    def __init__(self, dm, loader):
+        self.dm = dm
+        self.loader = loader
+
+    def __len__(self):
+        # Of a whole epoch, even when resuming part way through it
+        n_workers = max(self.loader.num_workers, 1)
+        stream = self.loader.dataset
+        stream.epoch = self.dm.epoch
+        return stream.n_batches(n_workers) * n_workers
+
+    def __iter__(self):
+        stream = self.loader.dataset
+        stream.epoch, stream.skip = self.dm.epoch, dict(self.dm.consumed)
+        self.dm.in_flight.clear()
+        for worker, batch in self.loader:
+            self.dm.in_flight.append(worker)
+            yield batch
+
+
+class _Progress(L.Callback):
+    """Count the batches that the model has trained on, rather than those that
+    Lightning has fetched ahead of it, and advance the epoch once it ends
+    (even when cut short, e.g. by `limit_train_batches`)"""
+
+    def on_train_batch_end(self, trainer, *args):
+        trainer.datamodule.batch_done()
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        trainer.datamodule.epoch_done()
+
+
+class StreamingDataModule(L.LightningDataModule):
+    """The images of a `DiffusionDataModule`, streamed from Parquet or tar
+    shards (see `write_shards`) rather than downloaded and cached"""
+
+    def __init__(
+        self,
+        images: DiffusionDataModule,
+        train_shards: str,
+        val_shards: str,
+        buffer_size: int = 4096,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.images = images
+        self.bs = images.bs
+        self.img_size = images.img_size
+        self.train_shards = sorted(glob(train_shards))
+        self.val_shards = sorted(glob(val_shards))
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.epoch = 0
+        self.consumed = collections.Counter()
+        # Workers of the batches handed to the trainer but not trained on yet
+        self.in_flight = collections.deque()
+
+    def setup(self, stage: str | None = None):
+        if self.trainer is not None and not any(
+            isinstance(c, _Progress) for c in self.trainer.callbacks
+        ):
+            self.trainer.callbacks.append(_Progress())
+
+    def batch_done(self):
+        """Count the oldest batch handed out as consumed"""
+        self.consumed[self.in_flight.popleft()] += 1
+
+    def epoch_done(self):
+        self.epoch += 1
+        self.consumed.clear()
+
+    def normalize(self, x_0):
+        return self.images.normalize(x_0)
+
+    @property
+    def n_workers(self):
+        return self.images.n_workers
+
+    @property
+    def noise_draws_per_image(self):
+        return self.images.noise_draws_per_image
+
+    @property
+    def world_size(self):
+        return 1 if self.trainer is None else self.trainer.world_size
+
+    def stream(self, shards, buffer_size, drop_last=True):
+        rank = 0 if self.trainer is None else self.trainer.global_rank
+        return ShardStream(
+            shards,
+            self.bs,
+            self.images.to_tensor,
+            buffer_size,
+            self.seed,
+            rank,
+            self.world_size,
+            drop_last,
+        )
+
+    def _collate(self, batch):
+        worker, x_0, _ = batch
+        if self.images.noisify_on_device:
+            return worker, x_0
+        return worker, self.images.noisify_fn(x_0, self.noise_draws_per_image)
+
+    def _seeded_collate(self, batch):
+        _, x_0, keys = batch
+        t = _splitmix64(keys.numpy()) >> np.uint64(40)
+        t = torch.from_numpy(t.astype(np.float32) * 2**-24)
+        return SeededBatch(x_0, t, keys)
+
+    def train_dataloader(self):
+        loader = DataLoader(
+            self.stream(self.train_shards, self.buffer_size),
+            batch_size=None,
+            collate_fn=self._collate,
+            num_workers=self.n_workers,
+        )
+        return _Resumable(self, loader)
+
+    def val_dataloader(self):
+        return DataLoader(
+            self.stream(self.val_shards, 0, drop_last=False),
+            batch_size=None,
+            collate_fn=self._seeded_collate,
+            num_workers=self.n_workers,
+        )
+
+    def state_dict(self):
+        return {
+            "epoch": self.epoch,
+            "consumed": dict(self.consumed),
+            "n_workers": self.n_workers,
+            "world_size": self.world_size,
+        }
+
+    def load_state_dict(self, state_dict):
+        for k in ("n_workers", "world_size"):
+            if state_dict[k] != getattr(self, k):
+                raise ValueError(
+                    f"can't resume with {k}={getattr(self, k)}, the "
+                    f"checkpoint was saved with {k}={state_dict[k]}"
+                )
+        self.epoch = state_dict["epoch"]
+        self.consumed = collections.Counter(state_dict["consumed"])
@@ -0,0 +1,126 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../nbs/11_timesteps.ipynb.
+
+# %% auto 0
+__all__ = ['TIMESTEP_SAMPLERS', 'LOSS_WEIGHTINGS', 'UniformSampler', 'StratifiedSampler', 'ImportanceSampler',
+           'get_timestep_sampler', 'no_weighting', 'min_snr', 'get_loss_weighting']
+
+# %% ../nbs/11_timesteps.ipynb 2
+import torch
+from torch import nn
+
+from .data import ᾱ
+
+# %% ../nbs/11_timesteps.ipynb 5
+class UniformSampler(nn.Module):
+    """t ~ U(0, 1), as `noisify` draws it"""
+
+    def sample(self, n, device=None):
+        return torch.rand(n, device=device)
+
+    def weights(self, t):
+        """Importance weights of the losses at `t`, so that their expectation
+        is that of uniform sampling"""
+        return torch.ones_like(t)
+
+    def update(self, t, losses, reduce=None):
+        """Record the (unweighted) losses at `t`. In distributed training,
+        `reduce` sums a tensor over the processes"""
+
+
+class StratifiedSampler(UniformSampler):
+    """One time step from each of `n` equal strata of [0, 1), in random order,
+    so that every batch covers the whole noise schedule"""
+
+    def sample(self, n, device=None):
+        return (torch.randperm(n, device=device) + torch.rand(n, device=device)) / n
+
+
+class ImportanceSampler(UniformSampler):
+    """Time steps drawn in proportion to the root mean square loss of their bin
+    of [0, 1), tracked with a moving average (https://arxiv.org/abs/2102.09672).
+    The histogram lives in buffers, so it is on the accelerator and in the
+    checkpoints, and it is never read back to the host. Every process updates
+    it with the losses of all of them, so that they draw from the same one"""
+
+    def __init__(self, n_bins=20, decay=0.99, uniform_mix=0.1):
+        super().__init__()
+        self.n_bins = n_bins
+        self.decay = decay
+        # Keep sampling every bin, so that its loss stays up to date
+        self.uniform_mix = uniform_mix
+        self.register_buffer("loss_sq", torch.zeros(n_bins))
+        self.register_buffer("seen", torch.zeros(n_bins, dtype=torch.bool))
+
+    def probs(self):
+        rms = self.loss_sq.sqrt()
+        p = rms / rms.sum().clamp(min=1e-12)
+        p = (1 - self.uniform_mix) * p + self.uniform_mix / self.n_bins
+        # Uniform until every bin has a loss
+        return torch.where(self.seen.all(), p, 1 / self.n_bins)
+
+    def bins(self, t):
+        return (t * self.n_bins).long().clamp(max=self.n_bins - 1)
+
+    def sample(self, n, device=None):
+        b = torch.multinomial(self.probs(), n, replacement=True)
+        t = (b + torch.rand(n, device=b.device)) / self.n_bins
+        return t.to(device)
+
+    def weights(self, t):
+        return 1 / (self.n_bins * self.probs()[self.bins(t)])
+
+    @torch.no_grad()
+    def update(self, t, losses, reduce=None):
+        b = self.bins(t)
+        zeros = torch.zeros_like(self.loss_sq)
+        total = zeros.index_add(0, b, losses.float() ** 2)
+        count = zeros.index_add(0, b, torch.ones_like(total[b]))
+        if reduce is not None:
+            total, count = reduce(torch.stack([total, count]))
+        hit = count > 0
+        # The first losses of a bin replace its zero initialization
+        decay = self.decay * self.seen
+        loss_sq = decay * self.loss_sq + (1 - decay) * total / count.clamp(min=1)
+        self.loss_sq.copy_(torch.where(hit, loss_sq, self.loss_sq))
+        self.seen |= hit
+
+
+TIMESTEP_SAMPLERS = {
+    "uniform": UniformSampler,
+    "stratified": StratifiedSampler,
+    "importance": ImportanceSampler,
+}
+
+
+def get_timestep_sampler(name):
+    try:
+        return TIMESTEP_SAMPLERS[name]()
+    except KeyError:
+        raise ValueError(
+            f"unknown timestep sampler {name!r}, expected one of {list(TIMESTEP_SAMPLERS)}"
+        )
+
+# %% ../nbs/11_timesteps.ipynb 8
+def no_weighting(t):
+    return torch.ones_like(t)
+
+
+def min_snr(t, γ=5.0):
+    """Min-SNR-γ weighting of the ε-prediction loss, min(SNR, γ) / SNR, so that
+    the nearly noiseless time steps don't dominate the gradients
+    (https://arxiv.org/abs/2303.09556)"""
+    ᾱ_ = ᾱ(t, reshape=False)
+    snr = ᾱ_ / (1 - ᾱ_)
+    return (γ / snr).clamp(max=1.0)
+
+
+LOSS_WEIGHTINGS = {"none": no_weighting, "min_snr": min_snr}
+
+
+def get_loss_weighting(name):
+    try:
+        return LOSS_WEIGHTINGS[name]
+    except KeyError:
+        raise ValueError(
+            f"unknown loss weighting {name!r}, expected one of {list(LOSS_WEIGHTINGS)}"
+        )
@@ -4,6 +4,7 @@
 __all__ = ['UnetLightning', 'get_tiny_unet_lightning']
 
 # %% ../nbs/01_training.ipynb 2
+import functools
 from typing import Callable, Sequence
 
 import lightning as L
@@ -11,7 +12,9 @@ import torch
 from beartype import beartype
 from torch import nn
 
-from .model import NonPreactResBlock, PreactResBlock, Unet
+from .data import noise_draws, noisify_batch
+from .model import NonPreactResBlock, PreactResBlock, Unet, compile_unet
+from .timesteps import get_loss_weighting, get_timestep_sampler
 
 # %% ../nbs/01_training.ipynb 3
 class UnetLightning(L.LightningModule):
@@ -29,6 +32,15 @@ class UnetLightning(L.LightningModule):
         act: type[torch.nn.Module] | str = "torch.nn.ReLU",
         res_block_cls: type[nn.Module] | str = "PreactResBlock",
         kaiming: bool = False,
+        checkpoint_levels: Sequence[int] = (),
+        compile: bool = False,
+        compile_mode: str | None = None,
+        compile_dynamic: bool | None = None,
+        compile_modules: Sequence[str] = (),
+        memory_format: str = "contiguous_format",
+        timestep_sampler: str = "uniform",
+        loss_weighting: str = "none",
+        min_snr_gamma: float = 5.0,
     ):
         """Unet training code
 
@@ -50,33 +62,136 @@ class UnetLightning(L.LightningModule):
             act: activation function
             res_block_cls: classic or preactivation resblock
             kaiming: perform kaiming initialization
+            checkpoint_levels: resolution levels, from 0 (outermost) to
+                len(nfs) - 1 (middle block), to recompute during backprop
+                rather than keep in memory. Default: none
+            compile: compile the Unet with `torch.compile` when fitting,
+                falling back to eager mode if that fails
+            compile_mode: `torch.compile` mode, e.g. "reduce-overhead" or
+                "max-autotune". Default: torch's default
+            compile_dynamic: compile for dynamic shapes. Default: only after
+                a shape changes
+            compile_modules: names of Unet submodules to compile, e.g.
+                "downblocks.0" or "middle". Default: the whole Unet
+            memory_format: "contiguous_format" (NCHW) or "channels_last"
+                (NHWC), for the weights and every batch. Default: NCHW
+            timestep_sampler: how to draw the time steps of training batches,
+                "uniform", "stratified" or "importance". All but "uniform"
+                need a data module with `noisify_on_device`. Default: uniform
+            loss_weighting: how to weight the training loss by time step,
+                "none" or "min_snr". Default: none
+            min_snr_gamma: SNR above which "min_snr" weights losses down
         """
         super().__init__()
         if isinstance(act, str):
             act = eval(act)
         if isinstance(res_block_cls, str):
             res_block_cls = eval(res_block_cls)
+        if memory_format not in ("contiguous_format", "channels_last"):
+            raise ValueError(f"unsupported memory format: {memory_format}")
         self.unet = Unet(
             nfs=nfs,
             n_blocks=n_blocks,
             color_channels=color_channels,
             act=act,
             res_block_cls=res_block_cls,
+            checkpoint_levels=checkpoint_levels,
+            memory_format=getattr(torch, memory_format),
         )
         if kaiming:
             from slow_diffusion.init import kaiming as kaiming_
 
             self.unet.apply(kaiming_)
+        self.timestep_sampler = get_timestep_sampler(timestep_sampler)
+        self.loss_weighting = get_loss_weighting(loss_weighting)
+        if loss_weighting == "min_snr":
+            self.loss_weighting = functools.partial(
+                self.loss_weighting, γ=min_snr_gamma
+            )
         self.save_hyperparameters()
         self.loss_fn = torch.nn.MSELoss()
+        # Size of the training images, which the fully convolutional U-Net
+        # doesn't fix. Kept in the checkpoints for serving
+        self.img_size = None
 
-    def step(self, batch):
+    def on_fit_start(self):
+        if not self.hparams.compile:
+            return
+        dm = self.trainer.datamodule
+        # As many examples as the training batches, which can hold several
+        # noise draws of every image
+        bs = dm.bs * noise_draws(dm)
+        x_t = torch.randn(
+            bs, self.hparams.color_channels, *dm.img_size, device=self.device
+        )
+        t = torch.rand(bs, device=self.device)
+        with self.trainer.precision_plugin.forward_context():
+            compile_unet(
+                self.unet.train(),
+                x_t,
+                t,
+                mode=self.hparams.compile_mode,
+                dynamic=self.hparams.compile_dynamic,
+                modules=self.hparams.compile_modules,
+            )
+
+    def on_save_checkpoint(self, checkpoint):
+        img_size = getattr(self.trainer.datamodule, "img_size", None) or self.img_size
+        if img_size is not None:
+            checkpoint["img_size"] = tuple(img_size)
+
+    def on_load_checkpoint(self, checkpoint):
+        self.img_size = checkpoint.get("img_size")
+        # The state of the timestep sampler is a running estimate, so a model
+        # with another sampler than the checkpoint's starts its own afresh
+        # rather than failing to load strictly
+        state_dict = checkpoint["state_dict"]
+        prefix = "timestep_sampler."
+        expected = self.timestep_sampler.state_dict(prefix=prefix)
+        for k in [k for k in state_dict if k.startswith(prefix)]:
+            if k not in expected:
+                del state_dict[k]
+        for k, v in expected.items():
+            state_dict.setdefault(k, v)
+
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        dm = self.trainer.datamodule
+        t = None
+        if self.trainer.training and self.hparams.timestep_sampler != "uniform":
+            if not isinstance(batch, torch.Tensor):
+                raise ValueError(
+                    f"timestep_sampler={self.hparams.timestep_sampler!r} needs "
+                    "uint8 batches to noisify, see `noisify_on_device`"
+                )
+            t = self.timestep_sampler.sample(len(batch) * noise_draws(dm), self.device)
+        # Data modules can ship uint8 images, the noise is then drawn here
+        # rather than pickled by every worker or stored on disk
+        batch = noisify_batch(batch, dm, t)
+        # Convert on the device, the Unet would otherwise convert x_t anyway
+        # and the loss would mix layouts
+        (x_t, t), epsilon = batch
+        memory_format = self.unet.memory_format
+        x_t = x_t.contiguous(memory_format=memory_format)
+        epsilon = epsilon.contiguous(memory_format=memory_format)
+        return (x_t, t), epsilon
+
+    def step(self, batch, weighted=False):
         (x_t, t), epsilon = batch
         preds = self.unet(x_t, t)
-        return self.loss_fn(preds, epsilon)
+        hparams = self.hparams
+        if not weighted or (
+            hparams.timestep_sampler == "uniform" and hparams.loss_weighting == "none"
+        ):
+            return self.loss_fn(preds, epsilon)
+        # Per example, to weight by time step and to update the sampler with
+        losses = (preds - epsilon).float().pow(2).flatten(1).mean(1)
+        w = self.timestep_sampler.weights(t) * self.loss_weighting(t)
+        reduce = functools.partial(self.trainer.strategy.reduce, reduce_op="sum")
+        self.timestep_sampler.update(t, losses.detach(), reduce=reduce)
+        return (w * losses).mean()
 
     def training_step(self, batch, batch_idx):
-        loss = self.step(batch)
+        loss = self.step(batch, weighted=True)
         self.log("train_loss", loss, on_step=True, sync_dist=True)
         return loss
 